@@ -1,3 +1,8 @@
+from .ragged import Ragged, Text
+from .lazy import Lazy, Take, Concatenation
 from .dataset import Dataset
+from .storage import DatasetWriter
 from .step import Step
+from .neighbors import HashIndex
 from .embedding import Embedding
+from .pipeline import Pipeline
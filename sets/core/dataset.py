@@ -1,30 +1,139 @@
-import random
+import queue
+import threading
+import collections
 import numpy as np
+from sets.core import storage
+from sets.core.ragged import Ragged
+from sets.core.lazy import Lazy, Take
 
 
 class Dataset:
     """
-    A mapping from column names to immutable arrays of equal length.
+    A mapping from column names to immutable arrays of equal length. Columns
+    of variable length rows are stored as Ragged arrays. Lazy columns are
+    computed when accessed.
     """
 
     def __init__(self, **data):
         self._data = {}
         self._length = None
+        self._columns = None
         super().__init__()
         for column, data in data.items():
             self[column] = data
 
     @property
     def columns(self):
-        return sorted(self._data.keys())
+        if self._columns is None:
+            self._columns = sorted(self._data.keys())
+        return list(self._columns)
 
     def copy(self):
-        data = {x: self[x].copy() for x in self.columns}
+        """
+        Return a new dataset sharing the column buffers with this one. Since
+        columns are immutable, replacing a column in the copy does not affect
+        the original.
+        """
+        data = {x: self._data[x] for x in self.columns}
         return type(self)(**data)
 
-    def sample(self, size):
-        indices = random.sample(range(len(self)), size)
-        return self[indices]
+    def take(self, indices):
+        """
+        Select rows by their indices without copying. The returned dataset
+        gathers the rows of a column only when the column is accessed.
+        """
+        indices = np.arange(len(self))[indices]
+        data = {x: Take(self._data[x], indices) for x in self.columns}
+        return type(self)(**data)
+
+    def batches(self, size, shuffle=False, seed=None, drop_last=False,
+                prefetch=0, steps=None):
+        """
+        Iterate over batches of rows as dicts from column names to arrays. If
+        'shuffle', visit rows in random order determined by the seed. Steps
+        are callables applied to each batch as a dataset, for example an
+        embedding, so that their result is never computed for all rows at
+        once. If 'prefetch', a background thread prepares up to that many
+        batches while the caller processes the current one.
+        """
+        batches = self._batches(size, shuffle, seed, drop_last, steps or [])
+        if prefetch:
+            return self._prefetch(batches, prefetch)
+        return batches
+
+    def iter_chunks(self, size):
+        """
+        Iterate over datasets of consecutive rows that share the column
+        buffers of this dataset.
+        """
+        for start in range(0, len(self), size):
+            yield self[start:start + size]
+
+    def itertuples(self, name='Row', chunk=1024):
+        """
+        Iterate over rows as named tuples with the column names as fields.
+        Names that are not valid identifiers are replaced by positional ones.
+        """
+        row = collections.namedtuple(name, self.columns, rename=True)
+        for values in self._iter_rows(chunk):
+            yield row(*values)
+
+    def to_records(self):
+        """
+        Export the dataset as a structured Numpy array with one field per
+        column. Ragged columns become object fields of row arrays.
+        """
+        fields = []
+        for column in self.columns:
+            data = self[column]
+            if isinstance(data, Ragged):
+                fields.append((column, object))
+            else:
+                fields.append((column, data.dtype, data.shape[1:]))
+        records = np.empty(len(self), dtype=fields)
+        for column in self.columns:
+            data = self[column]
+            if isinstance(data, Ragged):
+                records[column] = list(data)
+            else:
+                records[column] = data
+        return records
+
+    def save(self, directory):
+        """
+        Store the dataset in a directory with one raw binary file per column
+        and a manifest describing their types and shapes.
+        """
+        data = {x: self[x] for x in self.columns}
+        storage.write_columns(directory, data, len(self))
+
+    @classmethod
+    def open(cls, directory, mmap=True):
+        """
+        Load a dataset stored by save() or DatasetWriter. If 'mmap', columns
+        are backed by read-only memory maps and only the accessed parts are
+        read from disk. Chunks written by DatasetWriter are presented as one
+        dataset whose columns read rows from the chunks they belong to.
+        """
+        return cls(**storage.read_columns(directory, mmap))
+
+    @classmethod
+    def open_chunks(cls, directory, mmap=True):
+        """
+        Yield the chunks of a dataset stored by DatasetWriter one after
+        another. A dataset stored by save() forms a single chunk.
+        """
+        for chunk in storage.chunks(directory):
+            yield cls.open(chunk, mmap)
+
+    def sample(self, size, seed=None):
+        """
+        Select distinct rows at random without copying, like take(). The
+        seed determines the rows.
+        """
+        indices = np.random.RandomState(seed).choice(
+            len(self), size, replace=False)
+        return self.take(indices)
 
     def __len__(self):
         return self._length
@@ -38,8 +147,7 @@ class Dataset:
         raise AttributeError
 
     def __iter__(self):
-        for index in range(len(self)):
-            yield tuple(self[x][index] for x in self.columns)
+        return self._iter_rows()
 
     def __eq__(self, other):
         if not isinstance(other, type(self)):
@@ -47,21 +155,26 @@ class Dataset:
         if self.columns != other.columns:
             return False
         for column in self.columns:
-            if not (self[column] == other[column]).all():
+            if not self._equal(self[column], other[column]):
                 return False
         return True
 
     def __getitem__(self, key):
         if isinstance(key, slice):
-            data = {x: self[x][key] for x in self.columns}
+            data = {x: self._data[x][key] for x in self.columns}
             return type(self)(**data)
-        if isinstance(key, (tuple, list)) and isinstance(key[0], int):
-            data = {x: self[x][key] for x in self.columns}
+        if self._is_row_indices(key):
+            data = {x: self._freeze(self._data[x][key]) for x in self.columns}
             return type(self)(**data)
         if isinstance(key, (tuple, list)) and isinstance(key[0], str):
-            data = {x: self[x] for x in key}
+            data = {x: self._data[x] for x in key}
             return type(self)(**data)
-        return self._data[key].copy()
+        column = self._data[key]
+        if isinstance(column, Lazy):
+            return column.materialize()
+        if isinstance(column, np.ndarray):
+            return column.view()
+        return column
 
     def __setitem__(self, key, data):
         if isinstance(key, (tuple, list)) and isinstance(key[0], str):
@@ -70,22 +183,28 @@ class Dataset:
             return
         if isinstance(key, (tuple, list)) and isinstance(key[0], int):
             raise NotImplementedError('column content is immutable')
-        data = np.array(data)
-        data.setflags(write=False)
-        if not data.size:
-            raise ValueError('must not be empty')
+        if isinstance(data, (Ragged, Lazy)):
+            if not len(data):
+                raise ValueError('must not be empty')
+        else:
+            if not isinstance(data, np.ndarray) or data.flags.writeable:
+                data = self._freeze(np.array(data))
+            if not data.size:
+                raise ValueError('must not be empty')
         if not self._length:
             self._length = len(data)
         if len(data) != self._length:
             raise ValueError('must have same length')
         self._data[key] = data
+        self._columns = None
 
     def __delitem__(self, key):
         if isinstance(key, (tuple, list)):
             for column in key:
                 del self._data[column]
-            return
-        del self._data[key]
+        else:
+            del self._data[key]
+        self._columns = None
 
     def __str__(self):
         message = ''
@@ -94,9 +213,92 @@ class Dataset:
             message += str(self[column]) + '\n\n'
         return message
 
+    @staticmethod
+    def _freeze(data):
+        """
+        Mark an array as read-only so that it can be shared between datasets
+        without copying. Ragged arrays are always read-only.
+        """
+        if isinstance(data, np.ndarray):
+            data.setflags(write=False)
+        return data
+
+    def _iter_rows(self, chunk=1024):
+        for part in self.iter_chunks(chunk):
+            yield from zip(*(part[x] for x in self.columns))
+
+    def _batches(self, size, shuffle, seed, drop_last, steps):
+        if shuffle:
+            order = np.random.RandomState(seed).permutation(len(self))
+        for start in range(0, len(self), size):
+            end = min(start + size, len(self))
+            if drop_last and end - start < size:
+                return
+            batch = self[order[start:end] if shuffle else slice(start, end)]
+            for step in steps:
+                batch = step(batch)
+            yield {x: batch[x] for x in batch.columns}
+
+    @staticmethod
+    def _prefetch(iterator, amount):
+        """
+        Consume an iterator in a background thread, keeping up to the amount
+        of items ready. Errors are raised in the calling thread.
+        """
+        buffer_ = queue.Queue(amount)
+        stop = threading.Event()
+        end = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    buffer_.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def produce():
+            try:
+                for item in iterator:
+                    put((item, None))
+                    if stop.is_set():
+                        return
+                put((end, None))
+            # Forward exits too, since the consumer would otherwise wait for
+            # the end forever.
+            except BaseException as error:  # pylint: disable=broad-except
+                put((end, error))
+
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while True:
+                item, error = buffer_.get()
+                if error is not None:
+                    raise error
+                if item is end:
+                    return
+                yield item
+        finally:
+            stop.set()
+
+    @staticmethod
+    def _is_row_indices(key):
+        if isinstance(key, np.ndarray):
+            return key.dtype.kind in 'iub'
+        return isinstance(key, (tuple, list)) and isinstance(key[0], int)
+
+    @staticmethod
+    def _equal(first, second):
+        ragged = isinstance(first, Ragged), isinstance(second, Ragged)
+        if any(ragged):
+            return all(ragged) and first == second
+        return (first == second).all()
+
     def __getstate__(self):
-        return {'length': self._length, 'data': self._data}
+        data = {x: self[x] for x in self.columns}
+        return {'length': self._length, 'data': data}
 
     def __setstate__(self, state):
         self._length = state['length']
-        self._data = state['data']
+        self._data = {k: self._freeze(v) for k, v in state['data'].items()}
+        self._columns = None
@@ -1,6 +1,7 @@
 import warnings
 import numpy as np
-from sets.core import Step
+from sets.core import Step, Ragged, Lazy
+from sets.core import neighbors
 
 
 class Embedding(Step):
@@ -10,32 +11,73 @@ class Embedding(Step):
     vector for falsy words.
     """
 
-    def __init__(self, words, embeddings, depth):
+    # Attributes that are derived from the state.
+    _derived = ('_index', '_shape', '_average', '_lengths', '_zeros')
+
+    def __init__(self, words, embeddings, depth, storage=None, dtype=None):
         """
         Words is a list of words to embedd. Embeddings is a numpy array of same
         length. Depth is the number of dimensions to keep. All further
-        dimensions are considered part of the word.
+        dimensions are considered part of the word. Embeddings are not copied,
+        so memory mapped tables stay on disk until accessed. Lazy tables only
+        compute the rows that are looked up.
+
+        To reduce memory, the table can be stored as 'float16' or as 'int8'
+        with a scale per row, and is converted back when words are looked up.
+        Dtype is the floating point type of the output, by default the type
+        of the embeddings or float32 for converted storage.
         """
-        self._index = {self.key(k): i for i, k in enumerate(words)}
-        if len(self._index) != len(words):
+        self._words = np.asarray(words)
+        self._index = self._build_index()
+        if len(self._index) != len(self._words):
             warnings.warn('the keys of some words override each other')
-        self._embeddings = np.array(embeddings)
+        if not isinstance(embeddings, Lazy):
+            embeddings = np.asarray(embeddings)
+        self._embeddings, self._scales = self._store(embeddings, storage)
+        if dtype is None and storage:
+            dtype = np.float32
+        elif dtype is None:
+            dtype = embeddings.dtype
+            dtype = dtype if dtype.kind == 'f' else np.float64
+        self._dtype = np.dtype(dtype)
         self._depth = depth
-        self._shape = self._embeddings.shape[1:]
-        self._average = self._embeddings.mean(axis=0)
-        self._zeros = np.zeros(self.shape)
+        self._derive()
 
     @property
     def shape(self):
         return self._shape
 
-    def __call__(self, dataset, columns=None, return_found=False):
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def words(self):
+        return self._words
+
+    @property
+    def embeddings(self):
+        return self._embeddings
+
+    def __call__(self, dataset, columns=None, return_found=False,
+                 vocabulary=None):
+        """
+        Replace the words in the columns by their embeddings. If the columns
+        contain ids encoded by a Vocabulary, pass it to look up the ids by
+        indexing into a table of its words without hashing any strings.
+        """
         # pylint: disable=arguments-differ
         dataset = dataset.copy()
         columns = columns or dataset.columns
+        if vocabulary is not None:
+            table, known = self._vocabulary_table(vocabulary)
         found, overall = 0, 0
         for column in columns:
-            dataset[column], f, o = self._lookup_all(dataset[column])
+            if vocabulary is None:
+                dataset[column], f, o = self._lookup_all(dataset[column])
+            else:
+                dataset[column], f, o = self._lookup_ids(
+                    dataset[column], table, known)
             found += f
             overall += o
         if return_found:
@@ -47,36 +89,199 @@ class Embedding(Step):
 
     def __getitem__(self, word):
         index = self._index[self.key(word)]
-        embedding = self._embeddings[index]
-        return embedding
+        return self._dequantize(index)
 
     def key(self, word):
         # pylint: disable=no-self-use
         if isinstance(word, np.ndarray):
-            return word.tostring()
+            return word.tobytes()
         return word
 
     def fallback(self, word):
+        if self._average is None:
+            self._average = self._mean()
         return self._average
 
+    def most_similar(self, word_or_vector, k=10, index=None):
+        """
+        The k words whose embeddings have the highest cosine similarity to
+        the embedding of a word or to a vector, as pairs of word and
+        similarity in decreasing order. A word is not similar to itself. For
+        approximate search, pass a HashIndex of the embeddings.
+        """
+        exclude = None
+        vector = word_or_vector
+        numeric = isinstance(vector, np.ndarray) and vector.dtype.kind in 'fc'
+        if not numeric or vector.shape != self.shape:
+            exclude = self._index[self.key(word_or_vector)]
+            vector = self._dequantize(exclude)
+        extra = 0 if exclude is None else 1
+        indices, similarities = self.most_similar_batch(
+            vector[None], k + extra, index)
+        pairs = [
+            (self._words[x], y) for x, y in zip(indices[0], similarities[0])
+            if x >= 0 and x != exclude]
+        return pairs[:k]
+
+    def most_similar_batch(self, matrix, k=10, index=None):
+        """
+        Search the k most similar embeddings for each row of a matrix of
+        vectors. Return their indices into the words and their cosine
+        similarities, both of shape rows by k.
+        """
+        if isinstance(self._embeddings, Lazy):
+            message = 'cannot search neighbors in the lazy table of {}'
+            raise ValueError(message.format(type(self).__name__))
+        matrix = np.asarray(matrix)
+        if matrix.shape[1:] != self.shape:
+            message = 'shape {} differs from embeddings of shape {}'
+            raise ValueError(message.format(matrix.shape[1:], self.shape))
+        if index is not None:
+            return index.most_similar(matrix, k)
+        # Cosine similarities do not depend on the scale of each row, so
+        # quantized codes are searched directly.
+        if self._lengths is None:
+            self._lengths = neighbors.norms(self._embeddings)
+        return neighbors.most_similar(
+            self._embeddings, matrix, k, self._lengths)
+
+    def __getstate__(self):
+        # Only keep the words and the table, since the index and cached
+        # values are derived from them. This keeps fingerprints quick and
+        # independent of which cached values have been computed.
+        state = vars(self).copy()
+        for name in self._derived:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self._index = self._build_index()
+        self._derive()
+
+    def _build_index(self):
+        words = self._words
+        words = words.tolist() if words.ndim == 1 else list(words)
+        return {self.key(k): i for i, k in enumerate(words)}
+
+    def _derive(self):
+        self._shape = self._embeddings.shape[1:]
+        self._average = None
+        self._lengths = None
+        self._zeros = np.zeros(self.shape, self._dtype)
+
     def _lookup_all(self, array):
-        array_shape = array.shape[:self._depth]
-        embedded = np.empty(array_shape + self.shape)
-        found, overall = 0, 0
-        for index in np.ndindex(array_shape):
-            word = array[index]
-            found += word in self or self._is_null(word)
-            overall += 1
-            embedded[index] = self._lookup(word)
-        return embedded, found, overall
-
-    def _lookup(self, word):
-        if word in self:
-            return self[word]
-        if self._is_null(word):
-            return self._zeros
+        if not isinstance(array, Ragged):
+            return self._lookup_values(array, self._depth)
+        # The rows of ragged arrays are flattened into the first dimension.
+        if self._depth < 2:
+            raise ValueError('ragged columns require a depth of two or more')
+        embedded, found, overall = self._lookup_values(
+            array.values, self._depth - 1)
+        return array.with_values(embedded), found, overall
+
+    def _vocabulary_table(self, vocabulary):
+        """
+        Embeddings of all ids of a vocabulary and whether they count as
+        found. Padding is embedded like falsy words and unknown ids like
+        unknown words.
+        """
+        table, found = self._table(vocabulary.words)
+        padding = self._zeros[None]
+        unknown = np.asarray(self.fallback(None), self._dtype)[None]
+        table = np.concatenate([padding, unknown, table])
+        known = np.concatenate([[True, False], found])
+        return table, known
+
+    def _lookup_ids(self, ids, table, known):
+        if isinstance(ids, Ragged):
+            embedded, found, overall = self._lookup_ids(
+                ids.values, table, known)
+            return ids.with_values(embedded), found, overall
+        embedded = np.take(table, ids, axis=0)
+        counts = np.bincount(ids.reshape(-1), minlength=len(table))
+        return embedded, int(counts[known].sum()), ids.size
+
+    def _lookup_values(self, array, depth):
+        array_shape = array.shape[:depth]
+        words = array.reshape((-1,) + array.shape[depth:])
+        uniques, inverse = self._unique(words)
+        table, found = self._table(uniques)
+        embedded = np.take(table, inverse, axis=0)
+        embedded = embedded.reshape(array_shape + self.shape)
+        counts = np.bincount(inverse, minlength=len(uniques))
+        return embedded, int(counts[found].sum()), len(inverse)
+
+    def _table(self, words):
+        """
+        Embed an array of distinct words. Return the embeddings and whether
+        each word was found or is falsy.
+        """
+        words = words.tolist() if words.ndim == 1 else list(words)
+        indices = [self._index.get(self.key(x)) for x in words]
+        known = np.array([x is not None for x in indices], dtype=bool)
+        null = np.array([self._is_null(x) for x in words], dtype=bool)
+        table = np.empty((len(words),) + self.shape, self._dtype)
+        table[known] = self._dequantize([x for x in indices if x is not None])
+        table[~known & null] = self._zeros
+        for index in np.flatnonzero(~known & ~null):
+            table[index] = self.fallback(words[index])
+        return table, known | null
+
+    @staticmethod
+    def _store(embeddings, storage, chunk=2 ** 16):
+        """
+        Convert the table to the storage type. Return the table and the scale
+        of each row, or None if not quantized. Rows are converted in chunks to
+        limit temporary memory.
+        """
+        if not storage:
+            return embeddings, None
+        if storage == 'float16':
+            return embeddings.astype(np.float16), None
+        if storage != 'int8':
+            raise ValueError('unknown storage {}'.format(storage))
+        codes = np.empty(embeddings.shape, np.int8)
+        scales = np.empty(len(embeddings), np.float32)
+        for start in range(0, len(embeddings), chunk):
+            rows = slice(start, start + chunk)
+            values = embeddings[rows].reshape((-1, codes[0].size))
+            values = values.astype(np.float32)
+            scale = np.abs(values).max(axis=1, initial=0) / 127
+            scale[scale == 0] = 1
+            values /= scale[:, None]
+            codes[rows] = np.round(values).reshape(codes[rows].shape)
+            scales[rows] = scale
+        return codes, scales
+
+    def _dequantize(self, indices):
+        """
+        Rows of the table in the output type.
+        """
+        rows = self._embeddings[indices].astype(self._dtype)
+        if self._scales is None:
+            return rows
+        scales = np.asarray(self._scales[indices], self._dtype)
+        return rows * scales.reshape(scales.shape + (1,) * len(self.shape))
+
+    def _mean(self, chunk=2 ** 16):
+        total = np.zeros(self.shape)
+        for start in range(0, len(self._embeddings), chunk):
+            rows = self._dequantize(slice(start, start + chunk))
+            total += rows.sum(axis=0, dtype=np.float64)
+        return (total / max(1, len(self._embeddings))).astype(self._dtype)
+
+    @staticmethod
+    def _unique(words):
+        """
+        Distinct words and the index of each word into them. Words can be
+        scalars or arrays of further dimensions.
+        """
+        if words.ndim == 1:
+            uniques, inverse = np.unique(words, return_inverse=True)
         else:
-            return self._average
+            uniques, inverse = np.unique(words, axis=0, return_inverse=True)
+        return uniques, inverse.reshape(-1)
 
     @staticmethod
     def _is_null(word):
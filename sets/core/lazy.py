@@ -0,0 +1,247 @@
+import numpy as np
+from sets.core.ragged import Ragged
+
+
+class Lazy:
+    """
+    Base class for columns that are computed from other arrays on access.
+    Indexing rows only computes the selected rows, while materialize()
+    computes the whole column.
+    """
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def __getitem__(self, key):
+        raise NotImplementedError
+
+    @property
+    def dtype(self):
+        raise NotImplementedError
+
+    def materialize(self):
+        raise NotImplementedError
+
+    def __array__(self, dtype=None, copy=None):
+        # pylint: disable=unused-argument
+        array = np.asarray(self.materialize())
+        return array if dtype is None else array.astype(dtype)
+
+
+class Take(Lazy):
+    """
+    Selection of rows from an array or ragged array by their indices.
+    """
+
+    def __init__(self, base, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        if isinstance(base, Take):
+            base, indices = base.base, base.indices[indices]
+        self._base = base
+        self._indices = indices
+        self._indices.setflags(write=False)
+
+    @property
+    def base(self):
+        return self._base
+
+    @property
+    def indices(self):
+        return self._indices
+
+    @property
+    def dtype(self):
+        return self._base.dtype
+
+    @property
+    def shape(self):
+        return (len(self),) + self._base.shape[1:]
+
+    @property
+    def ndim(self):
+        return self._base.ndim
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return type(self)(self._base, self._indices[key])
+        return self._base[self._indices[key]]
+
+    def materialize(self):
+        data = self._base[self._indices]
+        if isinstance(data, np.ndarray):
+            data.setflags(write=False)
+        return data
+
+
+class Concatenation(Lazy):
+    """
+    Arrays joined along an axis. Along the first axis, rows are read from
+    the part they belong to, and slices within one part are views of it.
+    Along further axes, only the selected rows of each part are joined.
+    Ragged arrays, including Text, can be joined along the first axis.
+
+    Materializing allocates the whole result, which is kept for further
+    reads. To process large columns, for example of a dataset stored in
+    chunks, iterate over Dataset.open_chunks() or Dataset.iter_chunks()
+    instead.
+    """
+
+    def __init__(self, parts, axis=0):
+        self._parts = list(parts)
+        self._axis = axis
+        self._materialized = None
+        if not self._parts:
+            raise ValueError('need at least one part')
+        self._ragged = isinstance(self._parts[0], Ragged)
+        if self._ragged:
+            self._validate_ragged()
+            lengths = [len(x) for x in self._parts]
+        else:
+            self._validate_shapes()
+            lengths = [x.shape[axis] for x in self._parts]
+        self._offsets = np.concatenate([[0], np.cumsum(lengths)])
+        self._offsets = self._offsets.astype(np.int64)
+        self._dtype = np.result_type(*[x.dtype for x in self._parts])
+
+    @property
+    def parts(self):
+        return list(self._parts)
+
+    @property
+    def axis(self):
+        return self._axis
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def shape(self):
+        if self._ragged:
+            return (int(self._offsets[-1]),)
+        shape = list(self._parts[0].shape)
+        shape[self._axis] = int(self._offsets[-1])
+        return tuple(shape)
+
+    @property
+    def ndim(self):
+        return 1 if self._ragged else self._parts[0].ndim
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if self._axis:
+            if isinstance(key, slice):
+                return type(self)([x[key] for x in self._parts], self._axis)
+            rows = [np.asarray(x[key]) for x in self._parts]
+            # Indexing by an integer removes the first dimension.
+            axis = self._axis - (rows[0].ndim < self.ndim)
+            return self._join(rows, axis)
+        if isinstance(key, (int, np.integer)):
+            key = range(len(self))[key]
+            part = np.searchsorted(self._offsets, key, side='right') - 1
+            return self._parts[part][key - self._offsets[part]]
+        if isinstance(key, slice) and key.indices(len(self))[2] == 1:
+            return self._slice(*key.indices(len(self))[:2])
+        return self._take(np.arange(len(self))[key])
+
+    def materialize(self, out=None):
+        """
+        Write each part into its place of a new array or the provided one,
+        for example a memory map, which is returned read-only. Without an
+        output, the result is computed once and kept.
+        """
+        if out is None and self._materialized is not None:
+            return self._materialized
+        if self._ragged:
+            data = self._join_ragged(self._parts)
+        else:
+            data = self._join(self._parts, self._axis, out)
+            if isinstance(data, np.memmap):
+                data.flush()
+            data.setflags(write=False)
+        if out is None:
+            self._materialized = data
+        return data
+
+    def _validate_ragged(self):
+        if self._axis:
+            raise ValueError('ragged arrays can only be joined along rows')
+        if not all(isinstance(x, Ragged) for x in self._parts):
+            raise ValueError('cannot join ragged and dense arrays')
+        if len({type(x) for x in self._parts}) != 1:
+            raise ValueError('cannot join text and other ragged arrays')
+        shapes = {x.values.shape[1:] for x in self._parts}
+        if len(shapes) != 1:
+            raise ValueError('parts differ in shape {}'.format(shapes))
+
+    def _validate_shapes(self):
+        axis = self._axis
+        if not 0 <= axis < self._parts[0].ndim:
+            raise ValueError('axis {} out of range'.format(axis))
+        shapes = {
+            x.shape[:axis] + x.shape[axis + 1:] + (x.ndim,)
+            for x in self._parts}
+        if len(shapes) != 1:
+            shapes = [x.shape for x in self._parts]
+            raise ValueError('parts differ in shape {}'.format(shapes))
+
+    @staticmethod
+    def _join_ragged(parts):
+        values = np.concatenate([x.values for x in parts])
+        ends = np.cumsum([len(x.values) for x in parts])
+        offsets = [x.offsets[1:] + end - len(x.values)
+                   for x, end in zip(parts, ends)]
+        offsets = np.concatenate([[0]] + offsets)
+        return type(parts[0])(values, offsets)
+
+    def _join(self, parts, axis, out=None):
+        if out is None:
+            shape = list(parts[0].shape)
+            shape[axis] = sum(x.shape[axis] for x in parts)
+            out = np.empty(shape, self._dtype)
+        start = 0
+        for part in parts:
+            index = (slice(None),) * axis
+            index += (slice(start, start + part.shape[axis]),)
+            out[index] = part
+            start += part.shape[axis]
+        return out
+
+    def _slice(self, start, stop):
+        parts = []
+        for index, part in enumerate(self._parts):
+            offset = self._offsets[index]
+            begin, end = max(start - offset, 0), min(stop - offset, len(part))
+            if begin < end:
+                parts.append(part[begin:end])
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return self._parts[0][:0]
+        return type(self)(parts, self._axis)
+
+    def _take(self, indices):
+        parts = np.searchsorted(self._offsets, indices, side='right') - 1
+        if self._ragged:
+            # Gather from each part and restore the order of the indices.
+            selected, order = [], []
+            for part in np.unique(parts):
+                mask = parts == part
+                rows = indices[mask] - self._offsets[part]
+                selected.append(self._parts[part][rows])
+                order.append(np.flatnonzero(mask))
+            if not selected:
+                return self._parts[0][:0]
+            data = self._join_ragged(selected)
+            return data[np.argsort(np.concatenate(order))]
+        data = np.empty((len(indices),) + self.shape[1:], self._dtype)
+        for part in np.unique(parts):
+            mask = parts == part
+            rows = indices[mask] - self._offsets[part]
+            data[mask] = self._parts[part][rows]
+        return data
@@ -0,0 +1,136 @@
+import numpy as np
+
+
+def norms(vectors):
+    """
+    Euclidean length of each row, flattening further dimensions.
+    """
+    vectors = vectors.reshape((len(vectors), -1))
+    return np.sqrt(np.einsum('ij,ij->i', vectors, vectors, dtype=np.float64))
+
+
+def most_similar(vectors, queries, k, lengths=None, chunk=2 ** 24):
+    """
+    Exact search for the k rows of the vectors with the highest cosine
+    similarity to each query. The precomputed lengths of the vectors can be
+    passed to avoid recomputing them. Both queries and vectors are processed
+    in blocks so that at most about 'chunk' similarities are held in memory,
+    and vectors that are half precision or not floating point, like
+    quantized codes, are only converted one block at a time. Return indices
+    and similarities of shape queries by k, ordered by decreasing similarity.
+    """
+    vectors = vectors.reshape((len(vectors), -1))
+    queries = queries.reshape((len(queries), -1))
+    lengths = norms(vectors) if lengths is None else lengths
+    # Rows of zero length have a similarity of zero to everything.
+    scale = 1 / np.where(lengths > 0, lengths, np.inf)
+    k = min(k, len(vectors))
+    # Matrix products are only fast for types that BLAS supports.
+    dtype = np.promote_types(vectors.dtype, np.float32)
+    indices = np.empty((len(queries), k), dtype=np.int64)
+    similarities = np.empty((len(queries), k))
+    block = max(1, min(len(queries), 1024))
+    size = max(1, chunk // block)
+    for start in range(0, len(queries), block):
+        rows = slice(start, start + block)
+        query = _normalize(queries[rows]).astype(dtype)
+        best = np.empty((len(query), 0), dtype=np.int64)
+        scores = np.empty((len(query), 0))
+        for begin in range(0, len(vectors), size):
+            part = vectors[begin: begin + size].astype(dtype, copy=False)
+            part = (query @ part.T) * scale[begin: begin + size]
+            # Merge the best of this block with the best of previous ones.
+            found, part = _top(part, k)
+            best = np.concatenate([best, found + begin], axis=1)
+            scores = np.concatenate([scores, part], axis=1)
+            order, scores = _top(scores, k)
+            best = np.take_along_axis(best, order, axis=1)
+        indices[rows], similarities[rows] = best, scores
+    return indices, similarities
+
+
+class HashIndex:
+    """
+    Approximate nearest neighbor index by random projection hashing. Each
+    table hashes vectors to the signs of their projections onto random
+    directions, so that vectors with a small angle between them likely share
+    a bucket. Queries only compare against the vectors in their buckets.
+    More tables increase recall, more bits per table reduce the candidates.
+    """
+
+    def __init__(self, vectors, bits=12, tables=8, seed=None):
+        if not 0 < bits < 63:
+            raise ValueError('bits must be between 1 and 62')
+        self._vectors = vectors.reshape((len(vectors), -1))
+        self._lengths = norms(self._vectors)
+        random = np.random.RandomState(seed)
+        self._projections = random.normal(
+            size=(tables, bits, self._vectors.shape[1]))
+        self._codes = []
+        self._orders = []
+        for table in range(tables):
+            codes = self._hash(self._vectors, table)
+            order = np.argsort(codes, kind='stable')
+            self._codes.append(codes[order])
+            self._orders.append(order)
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def candidates(self, query):
+        """
+        Indices of the vectors sharing a bucket with the query in any table.
+        """
+        query = query.reshape((1, -1))
+        found = []
+        for table, (codes, order) in enumerate(zip(self._codes, self._orders)):
+            code = self._hash(query, table)[0]
+            start = np.searchsorted(codes, code, side='left')
+            end = np.searchsorted(codes, code, side='right')
+            found.append(order[start:end])
+        return np.unique(np.concatenate(found))
+
+    def most_similar(self, queries, k):
+        """
+        Approximate search with the same interface as the exact search.
+        Positions without enough candidates have an index of -1 and a
+        similarity of negative infinity.
+        """
+        queries = queries.reshape((len(queries), -1))
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        similarities = np.full((len(queries), k), -np.inf)
+        for row, query in enumerate(queries):
+            candidates = self.candidates(query)
+            if not len(candidates):
+                continue
+            found, scores = most_similar(
+                self._vectors[candidates], query[None], k,
+                self._lengths[candidates])
+            indices[row, :found.shape[1]] = candidates[found[0]]
+            similarities[row, :found.shape[1]] = scores[0]
+        return indices, similarities
+
+    def _hash(self, vectors, table):
+        signs = (vectors @ self._projections[table].T) > 0
+        powers = 2 ** np.arange(signs.shape[1], dtype=np.int64)
+        return signs.astype(np.int64) @ powers
+
+
+def _normalize(vectors):
+    lengths = norms(vectors)[:, None]
+    return vectors / np.where(lengths > 0, lengths, 1)
+
+
+def _top(scores, k):
+    """
+    Indices and values of the k largest scores in each row, in decreasing
+    order. Only the selected scores are sorted.
+    """
+    if k < scores.shape[1]:
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    values = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-values, axis=1, kind='stable')
+    indices = np.take_along_axis(indices, order, axis=1)
+    return indices, np.take_along_axis(values, order, axis=1)
@@ -0,0 +1,63 @@
+from sets import utility
+from sets.core.step import Step
+
+
+class Pipeline(Step):
+    """
+    A sequence of steps that is evaluated lazily. The result of each stage is
+    cached under a fingerprint of the input dataset and of the steps and
+    arguments up to that stage. Running the pipeline again after changing a
+    stage only recomputes the stages from there on.
+    """
+
+    def __init__(self, directory=None):
+        """
+        Cache results inside the directory, by default the cache directory of
+        this class.
+        """
+        self._stages = []
+        self._directory = directory
+
+    def add(self, step, cache=True, **kwargs):
+        """
+        Append a step that is called with the dataset and the keyword
+        arguments. Stages without 'cache' are fused with the next stage: they
+        are evaluated together and their results are not stored. Return the
+        pipeline to allow chaining.
+        """
+        self._stages.append((step, kwargs, cache))
+        return self
+
+    def keys(self, dataset):
+        """
+        Fingerprints identifying the result of each stage.
+        """
+        keys = []
+        key = utility.fingerprint(dataset)
+        for step, kwargs, _ in self._stages:
+            key = utility.fingerprint((key, step, kwargs))
+            keys.append(key)
+        return keys
+
+    def __call__(self, dataset):
+        """
+        Return the result of the last stage, only evaluating stages whose
+        results are not cached yet.
+        """
+        return self._result(dataset, self.keys(dataset), len(self._stages))
+
+    def _result(self, dataset, keys, index):
+        if not index:
+            return dataset
+        step, kwargs, cache = self._stages[index - 1]
+
+        def compute(key):
+            # pylint: disable=unused-argument
+            return step(self._result(dataset, keys, index - 1), **kwargs)
+
+        if not cache:
+            return compute(None)
+        if not self._directory:
+            return self.disk_cache('stage', compute, keys[index - 1])
+        cached = utility.disk_cache('stage', self._directory)(compute)
+        return cached(keys[index - 1])
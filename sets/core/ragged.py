@@ -0,0 +1,196 @@
+import numpy as np
+
+
+class Ragged:
+    """
+    An immutable array of rows that differ in length. The rows are stored
+    back to back in one buffer of values, delimited by an array of offsets.
+    Further dimensions of the values are shared by all rows.
+    """
+
+    def __init__(self, values, offsets):
+        """
+        Row i consists of values[offsets[i]:offsets[i + 1]]. Arrays that are
+        already read-only are not copied.
+        """
+        self._values = self._freeze(values)
+        self._offsets = self._freeze(offsets, np.int64)
+        if self._offsets.ndim != 1 or not len(self._offsets):
+            raise ValueError('offsets must be a non-empty vector')
+        if self._offsets[0] != 0 or self._offsets[-1] != len(self._values):
+            raise ValueError('offsets must span all values')
+        if (np.diff(self._offsets) < 0).any():
+            raise ValueError('offsets must be increasing')
+
+    @classmethod
+    def from_sequences(cls, sequences, dtype=None):
+        """
+        Create from a list of rows, each being a list or array of values.
+        """
+        lengths = [len(x) for x in sequences]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        values = np.array([x for row in sequences for x in row], dtype=dtype)
+        return cls(values, offsets)
+
+    @property
+    def values(self):
+        return self._values
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def lengths(self):
+        return np.diff(self._offsets)
+
+    @property
+    def dtype(self):
+        return self._values.dtype
+
+    def with_values(self, values):
+        """
+        Create a ragged array of the same row lengths from new values, for
+        example after applying an element-wise operation to the values.
+        """
+        return type(self)(values, self._offsets)
+
+    def pad(self, width=None):
+        """
+        Convert into a dense array padded with zeros or empty strings. The
+        width defaults to the longest row.
+        """
+        lengths = self.lengths
+        width = lengths.max() if width is None else width
+        shape = (len(self), width) + self._values.shape[1:]
+        padded = np.zeros(shape, dtype=self.dtype)
+        rows = np.repeat(np.arange(len(self)), lengths)
+        positions = np.arange(len(self._values)) - self._offsets[rows]
+        keep = positions < width
+        padded[rows[keep], positions[keep]] = self._values[keep]
+        return padded
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __iter__(self):
+        for start, end in zip(self._offsets[:-1], self._offsets[1:]):
+            yield self._values[start:end]
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            key = range(len(self))[key]
+            return self._values[self._offsets[key]:self._offsets[key + 1]]
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step == 1:
+                stop = max(start, stop)
+                offsets = self._offsets[start:stop + 1]
+                values = self._values[offsets[0]:offsets[-1]]
+                return type(self)(values, offsets - offsets[0])
+            key = np.arange(start, stop, step)
+        return self._take(np.asarray(key))
+
+    def __eq__(self, other):
+        if not isinstance(other, Ragged):
+            return NotImplemented
+        return (
+            np.array_equal(self._offsets, other.offsets) and
+            np.array_equal(self._values, other.values))
+
+    __hash__ = None
+
+    def __str__(self):
+        rows = ', '.join(str(x) for x in self[:10])
+        more = ', ...' if len(self) > 10 else ''
+        return 'Ragged([{}{}])'.format(rows, more)
+
+    def __repr__(self):
+        return '<Ragged rows={} values={} dtype={}>'.format(
+            len(self), len(self._values), self.dtype)
+
+    def __getstate__(self):
+        return {'values': self._values, 'offsets': self._offsets}
+
+    def __setstate__(self, state):
+        self._values = self._freeze(state['values'])
+        self._offsets = self._freeze(state['offsets'], np.int64)
+
+    def _take(self, indices):
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        indices = np.arange(len(self))[indices]
+        lengths = self.lengths[indices]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        # Position of each selected value inside the old values buffer.
+        shift = np.repeat(self._offsets[indices] - offsets[:-1], lengths)
+        positions = np.arange(offsets[-1]) + shift
+        return type(self)(self._values[positions], offsets)
+
+    @staticmethod
+    def _freeze(array, dtype=None):
+        if not isinstance(array, np.ndarray) or array.flags.writeable:
+            array = np.array(array, dtype=dtype)
+            array.setflags(write=False)
+        elif dtype is not None and array.dtype != dtype:
+            array = array.astype(dtype)
+            array.setflags(write=False)
+        return array
+
+
+class Text(Ragged):
+    """
+    An immutable array of strings stored back to back as UTF-8 bytes,
+    delimited by byte offsets. Unlike Numpy string arrays, rows are not padded
+    to the longest string. Indexing a row returns a string.
+    """
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [x.encode('utf-8') for x in strings]
+        lengths = [len(x) for x in encoded]
+        offsets = np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)])
+        values = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return cls(values, offsets)
+
+    @classmethod
+    def from_sequences(cls, sequences, dtype=None):
+        # pylint: disable=unused-argument
+        return cls.from_strings(sequences)
+
+    def tolist(self):
+        return list(self)
+
+    def pad(self, width=None):
+        """
+        Convert into a Numpy string array, optionally truncating the strings
+        to the given width.
+        """
+        strings = self.tolist()
+        if width is not None:
+            strings = [x[:width] for x in strings]
+        return np.array(strings, dtype=str)
+
+    def __iter__(self):
+        data = self._values.tobytes()
+        for start, end in zip(self._offsets[:-1], self._offsets[1:]):
+            yield data[start:end].decode('utf-8')
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            row = super().__getitem__(key)
+            return row.tobytes().decode('utf-8')
+        return super().__getitem__(key)
+
+    def __array__(self, dtype=None, copy=None):
+        # pylint: disable=unused-argument
+        array = self.pad()
+        return array if dtype is None else array.astype(dtype)
+
+    def __str__(self):
+        rows = ', '.join(repr(x) for x in self[:10])
+        more = ', ...' if len(self) > 10 else ''
+        return 'Text([{}{}])'.format(rows, more)
+
+    def __repr__(self):
+        return '<Text rows={} bytes={}>'.format(len(self), len(self._values))
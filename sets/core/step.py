@@ -9,23 +9,56 @@ class Step:
     """
 
     @classmethod
-    def disk_cache(cls, basename, function, *args, method=True, **kwargs):
+    def disk_cache(cls, basename, function, *args, **kwargs):
         """
-        Cache the return value in the correct cache directory. Set 'method' to
-        false for static methods.
+        Cache the return value in the correct cache directory. All arguments
+        are used for invalidation, so pass bound methods without self or cls.
+        When the cache exceeds the configured size, the least recently used
+        entries of all steps are evicted.
         """
-        @utility.disk_cache(basename, cls.directory(), method=method)
+        config = utility.read_config()
+        directory = cls.directory(config.directory)
+
+        @utility.disk_cache(
+            basename, directory, max_size=config.cache_size,
+            root=config.directory)
+        def wrapper(*args, **kwargs):
+            return function(*args, **kwargs)
+
+        return wrapper(*args, **kwargs)
+
+    @classmethod
+    def disk_store(cls, basename, function, *args, **kwargs):
+        """
+        Like disk_cache() for functions that write a dataset into the
+        directory passed as their first argument instead of returning it.
+        """
+        config = utility.read_config()
+        directory = cls.directory(config.directory)
+
+        @utility.disk_cache(
+            basename, directory, max_size=config.cache_size,
+            root=config.directory, store=True)
         def wrapper(*args, **kwargs):
             return function(*args, **kwargs)
 
         return wrapper(*args, **kwargs)
 
     @classmethod
-    def download(cls, url, filename=None):
+    def download(cls, url, filename=None, **kwargs):
+        """
+        Download a file into the correct cache directory. Further arguments
+        like checksums are passed to utility.download().
+        """
+        return utility.download(url, cls.directory(), filename, **kwargs)
+
+    @classmethod
+    def download_all(cls, urls, filenames=None, **kwargs):
         """
-        Download a file into the correct cache directory.
+        Download multiple files concurrently into the correct cache directory.
+        Further arguments are passed to utility.download_all().
         """
-        return utility.download(url, cls.directory(), filename)
+        return utility.download_all(urls, cls.directory(), filenames, **kwargs)
 
     @classmethod
     def directory(cls, prefix=None):
@@ -0,0 +1,225 @@
+import os
+import json
+import shutil
+import tempfile
+import numpy as np
+from sets.core.ragged import Ragged, Text
+from sets.core.lazy import Concatenation
+
+
+MANIFEST = 'manifest.json'
+
+
+def is_stored(directory):
+    """
+    Whether the directory contains a completely written column store.
+    """
+    return os.path.isfile(os.path.join(directory, MANIFEST))
+
+
+def write_columns(directory, data, length):
+    """
+    Write a mapping from column names to arrays into the directory. Each
+    column is stored as one raw binary file, or two for ragged columns, and
+    described in a manifest. The manifest is written last so that partially
+    written stores are not recognized.
+    """
+    os.makedirs(directory, exist_ok=True)
+    columns = {}
+    for column, array in data.items():
+        if array.dtype.hasobject:
+            message = 'cannot store column {} of object type'
+            raise ValueError(message.format(column))
+        if isinstance(array, Ragged):
+            columns[column] = {
+                'kind': 'text' if isinstance(array, Text) else 'ragged',
+                'values': _write_array(
+                    directory, column + '.values', array.values),
+                'offsets': _write_array(
+                    directory, column + '.offsets', array.offsets),
+            }
+        else:
+            columns[column] = _write_array(directory, column, array)
+    manifest = {'length': length, 'columns': columns}
+    with open(os.path.join(directory, MANIFEST), 'w') as file_:
+        json.dump(manifest, file_, indent=2, sort_keys=True)
+
+
+def read_columns(directory, mmap=True):
+    """
+    Read a mapping from column names to arrays from the directory. If 'mmap',
+    the arrays are read-only memory maps so that only accessed pages are
+    loaded and the page cache is shared between processes.
+    """
+    manifest = _read_manifest(directory)
+    if 'chunks' in manifest:
+        parts = [read_columns(x, mmap) for x in chunks(directory)]
+        if not parts:
+            return {}
+        return {
+            x: Concatenation([y[x] for y in parts]) if len(parts) > 1
+            else parts[0][x] for x in parts[0]}
+    data = {}
+    for column, entry in manifest['columns'].items():
+        if entry.get('kind') in ('ragged', 'text'):
+            values = _read_array(directory, entry['values'], mmap)
+            offsets = _read_array(directory, entry['offsets'], mmap)
+            type_ = Text if entry['kind'] == 'text' else Ragged
+            data[column] = type_(values, offsets)
+        else:
+            data[column] = _read_array(directory, entry, mmap)
+    return data
+
+
+def chunks(directory):
+    """
+    Directories of the chunks of a store written by DatasetWriter, or the
+    directory itself for stores written at once.
+    """
+    manifest = _read_manifest(directory)
+    if 'chunks' not in manifest:
+        return [directory]
+    return [os.path.join(directory, x) for x in manifest['chunks']]
+
+
+class DatasetWriter:
+    """
+    Write a dataset that does not fit into memory by appending rows. Rows are
+    buffered and written as a separate store once there are enough of them
+    to fill a chunk. The dataset is written into a temporary directory and
+    only moved to its destination when closed, so that stores are either
+    complete or absent. Use as a context manager to close automatically or,
+    if an exception occurs, remove the partially written data. Columns of
+    strings are stored as Text, so that long strings like articles do not
+    pad all other rows.
+    """
+
+    def __init__(self, directory, chunk_size=10000):
+        if chunk_size < 1:
+            raise ValueError('chunk size must be positive')
+        directory = os.path.abspath(os.path.expanduser(directory))
+        parent, name = os.path.split(directory)
+        os.makedirs(parent, exist_ok=True)
+        self._directory = directory
+        self._temp = tempfile.mkdtemp(prefix='.' + name + '-', dir=parent)
+        self._chunk_size = chunk_size
+        self._columns = None
+        self._buffer = {}
+        self._buffered = 0
+        self._chunks = []
+        self._length = 0
+
+    @property
+    def directory(self):
+        return self._directory
+
+    def __len__(self):
+        """
+        Number of rows appended so far.
+        """
+        return self._length + self._buffered
+
+    def append(self, **row):
+        """
+        Append one row given as a value for each column.
+        """
+        self.extend(**{x: [y] for x, y in row.items()})
+
+    def extend(self, **columns):
+        """
+        Append multiple rows given as an equally long sequence for each
+        column. All rows must have the same columns.
+        """
+        if self._columns is None:
+            self._columns = sorted(columns.keys())
+            self._buffer = {x: [] for x in self._columns}
+        if sorted(columns.keys()) != self._columns:
+            message = 'columns {} differ from {}'
+            message = message.format(sorted(columns.keys()), self._columns)
+            raise ValueError(message)
+        lengths = {len(x) for x in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError('columns differ in length')
+        for column, values in columns.items():
+            self._buffer[column].extend(values)
+        self._buffered += lengths.pop() if lengths else 0
+        while self._buffered >= self._chunk_size:
+            self._flush(self._chunk_size)
+
+    def close(self):
+        """
+        Write the remaining rows and move the store to its destination. If
+        another writer completed the same destination first, its store is
+        kept.
+        """
+        if self._temp is None:
+            return
+        if self._buffered:
+            self._flush(self._buffered)
+        manifest = {'length': self._length, 'chunks': self._chunks}
+        with open(os.path.join(self._temp, MANIFEST), 'w') as file_:
+            json.dump(manifest, file_, indent=2, sort_keys=True)
+        try:
+            os.rename(self._temp, self._directory)
+        except OSError:
+            if not is_stored(self._directory):
+                raise
+            shutil.rmtree(self._temp, ignore_errors=True)
+        self._temp = None
+
+    def abort(self):
+        """
+        Discard all rows written so far.
+        """
+        if self._temp is not None:
+            shutil.rmtree(self._temp, ignore_errors=True)
+            self._temp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type_, value, traceback):
+        if type_ is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _flush(self, size):
+        data = {}
+        for column, values in self._buffer.items():
+            # Strings are not padded to the longest one of the chunk.
+            if isinstance(values[0], str):
+                data[column] = Text.from_strings(values[:size])
+            else:
+                data[column] = np.array(values[:size])
+            del values[:size]
+        name = 'chunk-{:05d}'.format(len(self._chunks))
+        write_columns(os.path.join(self._temp, name), data, size)
+        self._chunks.append(name)
+        self._length += size
+        self._buffered -= size
+
+
+def _read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST)) as file_:
+        return json.load(file_)
+
+
+def _write_array(directory, name, array):
+    filename = '{}.bin'.format(name)
+    np.ascontiguousarray(array).tofile(os.path.join(directory, filename))
+    return {
+        'filename': filename,
+        'dtype': array.dtype.str,
+        'shape': list(array.shape),
+    }
+
+
+def _read_array(directory, entry, mmap):
+    filepath = os.path.join(directory, entry['filename'])
+    dtype, shape = np.dtype(entry['dtype']), tuple(entry['shape'])
+    if mmap and np.prod(shape):
+        return np.memmap(filepath, dtype, mode='r', shape=shape)
+    array = np.fromfile(filepath, dtype).reshape(shape)
+    array.setflags(write=False)
+    return array
@@ -1,5 +1,4 @@
 import struct
-import array
 import gzip
 import numpy as np
 from sets.core import Step, Dataset
@@ -16,11 +15,17 @@ class Mnist(Step):
     and formatting. From: http://yann.lecun.com/exdb/mnist/
     """
 
-    def __new__(cls, host='http://yann.lecun.com/exdb/mnist'):
+    def __new__(cls, host='http://yann.lecun.com/exdb/mnist',
+                dtype=np.float64):
+        """
+        Pixels are cached as bytes. They are returned scaled to the 0-1 range
+        as the given floating point type, or unscaled if the type is uint8.
+        """
+        cls._validate_dtype(dtype)
         cls._host = host
-        train = cls.disk_cache('train', cls._train_dataset)
-        test = cls.disk_cache('test', cls._test_dataset)
-        return train, test
+        train = cls.disk_cache('train-raw', cls._train_dataset)
+        test = cls.disk_cache('test-raw', cls._test_dataset)
+        return cls._convert(train, dtype), cls._convert(test, dtype)
 
     @classmethod
     def download(cls, url):
@@ -28,43 +33,61 @@ class Mnist(Step):
         url = cls._host + '/' + url
         return super().download(url)
 
+    @classmethod
+    def download_all(cls, urls, filenames=None, **kwargs):
+        urls = [cls._host + '/' + x for x in urls]
+        return super().download_all(urls, filenames, **kwargs)
+
     @classmethod
     def _train_dataset(cls):
-        data = cls.download('/train-images-idx3-ubyte.gz')
-        target = cls.download('/train-labels-idx1-ubyte.gz')
+        data, target = cls.download_all([
+            'train-images-idx3-ubyte.gz', 'train-labels-idx1-ubyte.gz'])
         return cls._read_dataset(data, target)
 
     @classmethod
     def _test_dataset(cls):
-        data = cls.download('/t10k-images-idx3-ubyte.gz')
-        target = cls.download('/t10k-labels-idx1-ubyte.gz')
+        data, target = cls.download_all([
+            't10k-images-idx3-ubyte.gz', 't10k-labels-idx1-ubyte.gz'])
         return cls._read_dataset(data, target)
 
+    @staticmethod
+    def _validate_dtype(dtype):
+        dtype = np.dtype(dtype)
+        if dtype != np.uint8 and dtype.kind != 'f':
+            message = 'dtype must be uint8 or floating point, got {}'
+            raise ValueError(message.format(dtype))
+        return dtype
+
+    @classmethod
+    def _convert(cls, dataset, dtype):
+        if cls._validate_dtype(dtype) == np.uint8:
+            return dataset
+        data = dataset.data.astype(dtype)
+        data /= 255
+        target = dataset.target.astype(dtype)
+        return Dataset(data=data, target=target)
+
     @classmethod
     def _read_dataset(cls, data_filename, target_filename):
-        data_array, data_size, rows, cols = cls._read_data(data_filename)
-        target_array, target_size = cls._read_target(target_filename)
-        assert data_size == target_size
-        data = np.zeros((data_size, rows, cols))
-        target = np.zeros((target_size, 10))
-        for i in range(data_size):
-            current = data_array[i * rows * cols:(i + 1) * rows * cols]
-            data[i] = np.array(current).reshape(rows, cols) / 255
-            target[i, target_array[i]] = 1
+        data = cls._read_data(data_filename)
+        labels = cls._read_target(target_filename)
+        assert len(data) == len(labels)
+        target = np.zeros((len(labels), 10), dtype=np.uint8)
+        target[np.arange(len(labels)), labels] = 1
         return Dataset(data=data, target=target)
 
     @staticmethod
     def _read_data(filename):
         with gzip.open(filename, 'rb') as file_:
             _, size, rows, cols = struct.unpack('>IIII', file_.read(16))
-            target = array.array('B', file_.read())
-            assert len(target) == size * rows * cols
-            return target, size, rows, cols
+            data = np.frombuffer(file_.read(), dtype=np.uint8)
+            assert len(data) == size * rows * cols
+            return data.reshape((size, rows, cols))
 
     @staticmethod
     def _read_target(filename):
         with gzip.open(filename, 'rb') as file_:
             _, size = struct.unpack('>II', file_.read(8))
-            target = array.array('B', file_.read())
+            target = np.frombuffer(file_.read(), dtype=np.uint8)
             assert len(target) == size
-            return target, size
+            return target
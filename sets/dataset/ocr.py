@@ -1,5 +1,4 @@
 import gzip
-import csv
 import numpy as np
 from sets.core import Step, Dataset
 
@@ -8,19 +7,20 @@ class Ocr(Step):
     """
     Dataset of handwritten words collected by Rob Kassel at the MIT Spoken
     Language Systems Group. Each example contains the normalized letters of the
-    word, padded to the maximum word length. Only contains lower case letter,
-    capitalized letters were removed.
+    word, padded to the maximum word length. Pixels are binary and stored as
+    bytes. Only contains lower case letter, capitalized letters were removed.
     From: http://ai.stanford.edu/~btaskar/ocr/
     """
 
-    def __new__(cls, host='http://ai.stanford.edu/~btaskar/ocr/'):
+    def __new__(cls, host='http://ai.stanford.edu/~btaskar/ocr/',
+                dtype=np.float64):
+        """
+        Pixels are cached as bytes. They are returned as the given type, or
+        as cached if the type is uint8.
+        """
         cls._host = host
-        filepath = cls.download('letter.data.gz')
-        lines = cls._read(filepath)
-        data, target, fold = cls._parse(lines)
-        data, target = cls._pad(data, target)
-        dataset = Dataset(data=data, target=target, fold=fold)
-        return dataset
+        dataset = cls.disk_cache('dataset', cls._load)
+        return cls._convert(dataset, dtype)
 
     @classmethod
     def download(cls, filename):
@@ -28,36 +28,46 @@ class Ocr(Step):
         url = cls._host + '/' + filename
         return super().download(url, filename)
 
+    @classmethod
+    def _load(cls):
+        filepath = cls.download('letter.data.gz')
+        fields = cls._read(filepath)
+        data, target, fold = cls._parse(fields)
+        return Dataset(data=data, target=target, fold=fold)
+
     @staticmethod
-    def _pad(data, target):
-        max_length = max(len(x) for x in target)
-        padding = np.zeros((16, 8))
-        data = [x + ([padding] * (max_length - len(x))) for x in data]
-        target = [x + ([''] * (max_length - len(x))) for x in target]
-        return data, target
+    def _convert(dataset, dtype):
+        if np.dtype(dtype) == np.uint8:
+            return dataset
+        dataset = dataset.copy()
+        dataset['data'] = dataset.data.astype(dtype)
+        return dataset
 
     @staticmethod
-    def _parse(lines):
-        lines = sorted(lines, key=lambda x: int(x[0]))
-        data, target, fold = [], [], []
-        next_ = None
-        for line in lines:
-            if not next_:
-                data.append([])
-                target.append([])
-                fold.append(int(line[5]))
-            else:
-                assert next_ == int(line[0])
-            next_ = int(line[2]) if int(line[2]) > -1 else None
-            pixels = np.array([int(x) for x in line[6:134]])
-            pixels = pixels.reshape((16, 8))
-            data[-1].append(pixels)
-            target[-1].append(line[1])
+    def _parse(fields):
+        """
+        Group the letters into words following their next id links and place
+        them into preallocated arrays padded to the maximum word length.
+        """
+        fields = fields[np.argsort(fields[:, 0].astype(int), kind='stable')]
+        ids, next_ = fields[:, 0].astype(int), fields[:, 2].astype(int)
+        ends = next_ == -1
+        assert ends[-1]
+        assert (next_[:-1][~ends[:-1]] == ids[1:][~ends[:-1]]).all()
+        starts = np.concatenate([[True], ends[:-1]])
+        words = np.cumsum(starts) - 1
+        positions = np.arange(len(fields)) - np.flatnonzero(starts)[words]
+        shape = (words[-1] + 1, positions.max() + 1)
+        pixels = fields[:, 6:134].astype(np.uint8).reshape((-1, 16, 8))
+        data = np.zeros(shape + (16, 8), dtype=np.uint8)
+        data[words, positions] = pixels
+        target = np.zeros(shape, dtype='<U1')
+        target[words, positions] = fields[:, 1].astype('<U1')
+        fold = fields[starts, 5].astype(int)
         return data, target, fold
 
     @staticmethod
     def _read(filepath):
         with gzip.open(filepath, 'rt') as file_:
-            reader = csv.reader(file_, delimiter='\t')
-            lines = list(reader)
-            return lines
+            lines = file_.read().splitlines()
+        return np.array([x.split('\t')[:134] for x in lines])
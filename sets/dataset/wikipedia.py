@@ -1,7 +1,13 @@
+import os
 import re
+import bz2
+import functools
+import itertools
+import collections
+from concurrent.futures import ProcessPoolExecutor
 from lxml import etree
 from bz2 import BZ2File
-from sets.core import Step, Dataset
+from sets.core import Step, DatasetWriter
 
 
 class Wikipedia(Step):
@@ -9,28 +15,105 @@ class Wikipedia(Step):
     Titles and plain text of Wikipedia articles. By default, this is extracted
     from the English dump of May 2016. For an overview of available Wikipedia
     dumps visit: https://dumps.wikimedia.org/backup-index.html
+    Multistream dumps can be parsed in parallel by also providing the url of
+    their index.
     """
 
     TOKEN_REGEX = re.compile(r'[A-Z]*[a-z]+|[A-Z]+[a-z]*')
 
     def __new__(cls, url='https://dumps.wikimedia.org/enwiki/20160501/'
-                'enwiki-20160501-pages-meta-current.xml.bz2', amount=None):
+                'enwiki-20160501-pages-meta-current.xml.bz2', amount=None,
+                index=None, workers=None):
         filepath = cls.download(url)
-        dataset = cls.disk_cache('dataset', cls._parse, filepath, amount)
-        return dataset
+        if not index:
+            return cls.disk_store('dataset', cls._parse, filepath, amount)
+        index = cls.download(index)
+        # The number of workers does not affect the result.
+        parse = functools.partial(cls._parse_multistream, workers=workers)
+        return cls.disk_store('dataset', parse, filepath, index, amount)
 
     @classmethod
-    def _parse(cls, filepath, amount=None):
-        pages = []
+    def _parse(cls, directory, filepath, amount=None):
+        """
+        Parse the pages of a dump sequentially and write them into a chunked
+        store at the directory.
+        """
         with BZ2File(filepath) as file_:
-            for element in cls._stream(file_, '{*}page'):
-                if amount and len(pages) >= amount:
+            pages = (cls._process(x) for x in cls._stream(file_, '{*}page'))
+            cls._write(pages, directory, amount)
+
+    @classmethod
+    def _parse_multistream(
+            cls, directory, filepath, index, amount=None, workers=None):
+        """
+        Decompress and parse the independent bz2 streams of a multistream
+        dump in a pool of worker processes. The index lists the byte offset
+        of the stream containing each page.
+        """
+        offsets = cls._read_offsets(index)
+        ends = offsets[1:] + [os.path.getsize(filepath)]
+        streams = cls._map_streams(filepath, offsets, ends, workers)
+        cls._write(itertools.chain.from_iterable(streams), directory, amount)
+
+    @classmethod
+    def _write(cls, pages, directory, amount=None):
+        """
+        Write articles into a chunked store as they are parsed, so that only
+        one chunk is held in memory. The text columns are stored unpadded, so
+        the writer's default chunk size bounds memory by the total length of
+        its articles rather than by the longest one.
+        """
+        with DatasetWriter(directory) as writer:
+            for page in pages:
+                if amount and len(writer) >= amount:
                     break
-                page = cls._process(element)
                 if page:
-                    pages.append(page)
-        ids, titles, contents = zip(*pages)
-        return Dataset(ids=ids, title=titles, content=contents)
+                    id_, title, content = page
+                    writer.append(ids=id_, title=title, content=content)
+
+    @classmethod
+    def _map_streams(cls, filepath, starts, ends, workers=None):
+        """
+        Yield the pages of each stream in order. Only a few streams per worker
+        are submitted ahead so that stopping early does not parse the rest.
+        """
+        ahead = 2 * (workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(workers) as executor:
+            pending = collections.deque()
+            try:
+                for start, end in zip(starts, ends):
+                    pending.append(executor.submit(
+                        cls._parse_stream, filepath, start, end))
+                    if len(pending) >= ahead:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    @classmethod
+    def _parse_stream(cls, filepath, start, end):
+        with open(filepath, 'rb') as file_:
+            file_.seek(start)
+            data = bz2.decompress(file_.read(end - start))
+        # Streams contain a sequence of pages, except for the header and
+        # footer of the whole document in the first and last stream.
+        first, last = data.find(b'<page>'), data.rfind(b'</page>')
+        if first < 0 or last < 0:
+            return []
+        data = b'<pages>' + data[first:last + len(b'</page>')] + b'</pages>'
+        pages = etree.fromstring(data).iterfind('{*}page')
+        pages = [cls._process(x) for x in pages]
+        return [x for x in pages if x]
+
+    @staticmethod
+    def _read_offsets(index):
+        offsets = set()
+        with bz2.open(index, 'rt', encoding='utf-8') as file_:
+            for line in file_:
+                offsets.add(int(line.split(':', 1)[0]))
+        return sorted(offsets)
 
     @classmethod
     def _process(cls, element):
@@ -1,7 +1,9 @@
+from .bucket import Bucket
 from .concat import Concat
 from .glove import Glove
 from .normalize import Normalize
 from .onehot import OneHot
-from .split import Split
+from .split import Split, KFold
 from .word_distance import WordDistance
 from .tokenize import Tokenize
+from .vocabulary import Vocabulary
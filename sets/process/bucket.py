@@ -0,0 +1,104 @@
+import numpy as np
+from sets.core import Step, Dataset
+
+
+class Bucket(Step):
+    """
+    Group rows by the length of their padded sequences and trim the padding
+    of each group to its longest sequence.
+    """
+
+    def __init__(self, *boundaries, amount=4, padding=''):
+        """
+        Boundaries are the maximum sequence lengths of the buckets in
+        increasing order, longer sequences form the last bucket. Without
+        boundaries, quantiles of the lengths form the given amount of buckets.
+        """
+        if list(boundaries) != sorted(set(boundaries)):
+            raise ValueError('boundaries must be unique and in order')
+        self._boundaries = boundaries
+        self._amount = amount
+        self._padding = padding
+
+    def __call__(self, dataset, column, columns=None, size=None,
+                 index='index'):
+        """
+        Yield one dataset per non-empty bucket, or batches of at most 'size'
+        rows of each bucket. Sequences are along the second axis of the
+        column and their padding is trimmed from all columns, defaulting to
+        the columns of the same width. The original row positions are stored
+        in the index column for restore().
+        """
+        # pylint: disable=arguments-differ
+        if index in dataset:
+            raise ValueError('column {} already exists'.format(index))
+        lengths = self.lengths(dataset[column])
+        width = dataset[column].shape[1]
+        if columns is None:
+            columns = [
+                x for x in dataset.columns
+                if dataset[x].ndim > 1 and dataset[x].shape[1] == width]
+        boundaries = self._boundaries or self._quantiles(lengths)
+        assignments = np.searchsorted(boundaries, lengths)
+        for bucket in np.unique(assignments):
+            rows = np.flatnonzero(assignments == bucket)
+            width = max(lengths[rows].max(), 1)
+            for start in range(0, len(rows), size or len(rows)):
+                batch = rows[start:start + (size or len(rows))]
+                yield self._trim(dataset, batch, columns, width, index)
+
+    @staticmethod
+    def restore(buckets, index='index'):
+        """
+        Combine buckets into one dataset of the original row order. Columns
+        of different widths are padded with zeros or empty strings.
+        """
+        buckets = list(buckets)
+        indices = np.concatenate([x[index] for x in buckets])
+        order = np.argsort(indices)
+        data = {}
+        for column in buckets[0].columns:
+            if column == index:
+                continue
+            arrays = [x[column] for x in buckets]
+            if arrays[0].ndim > 1:
+                width = max(x.shape[1] for x in arrays)
+                arrays = [Bucket._pad(x, width) for x in arrays]
+            data[column] = np.concatenate(arrays)[order]
+        return Dataset(**data)
+
+    def lengths(self, array):
+        """
+        Number of elements before the trailing padding of each row.
+        """
+        mask = array != self._padding
+        if mask.ndim > 2:
+            mask = mask.reshape(mask.shape[:2] + (-1,)).any(axis=2)
+        last = mask.shape[1] - np.argmax(mask[:, ::-1], axis=1)
+        return np.where(mask.any(axis=1), last, 0)
+
+    def _quantiles(self, lengths):
+        ratios = np.linspace(0, 1, self._amount + 1)[1:-1]
+        return np.unique(np.quantile(lengths, ratios).astype(int))
+
+    @staticmethod
+    def _trim(dataset, rows, columns, width, index):
+        others = [x for x in dataset.columns if x not in columns]
+        subset = dataset[others][rows.tolist()] if others else Dataset()
+        for column in columns:
+            # Only gather the trimmed cells, so that the bucket does not keep
+            # a full width array alive through a view.
+            cells = np.ascontiguousarray(dataset[column][rows, :width])
+            cells.setflags(write=False)
+            subset[column] = cells
+        subset[index] = rows
+        return subset
+
+    @staticmethod
+    def _pad(array, width):
+        if array.shape[1] == width:
+            return array
+        padded = np.zeros(array.shape[:1] + (width,) + array.shape[2:],
+                          dtype=array.dtype)
+        padded[:, :array.shape[1]] = array
+        return padded
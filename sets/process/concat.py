@@ -1,20 +1,56 @@
+import os
+import itertools
 import numpy as np
-from sets.core import Step
+from sets.core import Step, Concatenation
 
 
 class Concat(Step):
 
-    def __init__(self, axis, target='data'):
+    def __init__(self, axis, target='data', lazy=False, filename=None):
+        """
+        Join columns along an axis of their rows into the target column. The
+        result is allocated once and each column is written into it, into a
+        memory map at the filename if provided. Existing files are never
+        overwritten, so that earlier results stay valid: if the file exists,
+        a number is appended to the name. If 'lazy', the target column
+        instead joins the rows of the columns when accessed, so that batches
+        never need the whole result in memory.
+        """
         if axis < 1:
             raise ValueError('concat axis must be one or higher')
+        if lazy and filename:
+            raise ValueError('lazy results are not written to a file')
         self._axis = axis
         self._target = target
+        self._lazy = lazy
+        self._filename = filename
 
     def __call__(self, dataset, columns=None):
         dataset = dataset.copy()
         columns = columns or dataset.columns
-        arrays = [dataset[x] for x in columns]
-        result = np.concatenate(arrays, axis=self._axis)
+        result = Concatenation([dataset[x] for x in columns], self._axis)
+        if not self._lazy:
+            out = None
+            if self._filename:
+                out = np.memmap(
+                    self._claim(), result.dtype, 'r+', shape=result.shape)
+            result = result.materialize(out)
         del dataset[columns]
         dataset[self._target] = result
         return dataset
+
+    def _claim(self):
+        """
+        Create a new file at the filename or, if taken, at the first free
+        numbered variant of it.
+        """
+        base, extension = os.path.splitext(self._filename)
+        for number in itertools.count():
+            filename = self._filename
+            if number:
+                filename = '{}-{}{}'.format(base, number, extension)
+            try:
+                with open(filename, 'xb'):
+                    return filename
+            except FileExistsError:
+                pass
@@ -1,6 +1,6 @@
 from zipfile import ZipFile
 import numpy as np
-from sets.core import Embedding
+from sets.core import Embedding, Dataset
 
 
 class Glove(Embedding):
@@ -11,10 +11,16 @@ class Glove(Embedding):
 
     URL = 'http://nlp.stanford.edu/data/glove.6B.zip'
 
-    def __init__(self, size=100, depth=1):
+    def __init__(self, size=100, depth=1, storage=None, dtype=None):
+        """
+        The archive is converted into a binary store once. Later instances
+        memory map the vectors, so they start quickly and share memory across
+        processes. Storage and dtype are passed to Embedding.
+        """
         assert size in (50, 100, 300)
-        words, embeddings = self.disk_cache('data', self._load, size)
-        super().__init__(words, embeddings, depth)
+        store = self.disk_cache('vectors', self._load, size)
+        super().__init__(
+            store['words'], store['embeddings'], depth, storage, dtype)
         assert self.shape == (size,)
 
     @classmethod
@@ -23,16 +29,21 @@ class Glove(Embedding):
         with ZipFile(filepath, 'r') as archive:
             filename = 'glove.6B.{}d.txt'.format(size)
             with archive.open(filename) as file_:
-                return cls._parse(file_)
+                words, embeddings = cls._parse(file_, size)
+        return Dataset(words=words, embeddings=embeddings)
 
     @staticmethod
-    def _parse(file_):
-        words = []
-        embeddings = []
-        for line in file_:
-            chunks = line.split()
-            word = chunks[0].decode('utf-8')
-            embedding = np.array(chunks[1:]).astype(np.float32)
-            words.append(word)
-            embeddings.append(embedding)
-        return np.array(words), np.array(embeddings)
+    def _parse(file_, size, chunk=2 ** 24):
+        """
+        Parse lines of a word followed by its vector components. Lines are
+        read in chunks of about the given number of bytes and the numbers of
+        each chunk are converted at once.
+        """
+        words, embeddings = [], []
+        for lines in iter(lambda: file_.readlines(chunk), []):
+            chunks = [x.rstrip().rsplit(b' ', size) for x in lines]
+            words += [x[0].decode('utf-8') for x in chunks]
+            values = b' '.join(b' '.join(x[1:]) for x in chunks).split()
+            values = np.array(values, dtype=np.float32)
+            embeddings.append(values.reshape((len(chunks), size)))
+        return np.array(words), np.concatenate(embeddings)
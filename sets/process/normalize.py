@@ -1,38 +1,114 @@
-from sets.core import Step
+import numpy as np
+from sets.core import Step, Dataset
 
 
 class Normalize(Step):
 
-    def __init__(self, reference):
+    def __init__(self, reference=None):
+        """
+        Fit mean and std to the columns of a reference dataset or of an
+        iterable of dataset chunks. Statistics are accumulated in a
+        numerically stable way, so more chunks can be added by update() and
+        instances fitted on different parts can be combined by merge().
+        """
+        self._counts = {}
         self._means = {}
-        self._stds = {}
-        self._shapes = {}
-        for column in reference.columns:
-            data = reference[column]
-            shape = data.shape[1:]
-            mean, std = data.mean(axis=0), data.std(axis=0)
-            assert mean.shape == std.shape == shape
-            self._means[column] = mean
-            self._stds[column] = std
-            self._shapes[column] = shape
+        self._squares = {}
+        if reference is None:
+            return
+        chunks = [reference] if isinstance(reference, Dataset) else reference
+        for chunk in chunks:
+            self.update(chunk)
 
     @property
     def columns(self):
-        return self._means.columns
+        return sorted(self._means.keys())
+
+    def update(self, dataset, columns=None, chunk=2 ** 16):
+        """
+        Add the rows of a dataset to the statistics. Rows are processed in
+        chunks to limit temporary memory, so that columns backed by memory
+        maps are never loaded as a whole.
+        """
+        columns = columns or dataset.columns
+        for column in columns:
+            data = dataset[column]
+            for start in range(0, len(data), chunk):
+                part = data[start: start + chunk]
+                mean = part.mean(axis=0, dtype=np.float64)
+                deviations = np.subtract(part, mean)
+                squares = np.square(deviations, out=deviations).sum(axis=0)
+                self._combine(column, len(part), mean, squares)
+        return self
+
+    def merge(self, other):
+        """
+        Add the statistics of another instance, for example fitted on a
+        different part of the data in another process.
+        """
+        for column in other.columns:
+            self._combine(
+                column, other._counts[column], other._means[column],
+                other._squares[column])
+        return self
 
-    def __call__(self, dataset, columns=None):
+    def mean(self, column):
+        self._validate_reference(column)
+        return self._means[column]
+
+    def std(self, column):
+        self._validate_reference(column)
+        return np.sqrt(self._squares[column] / self._counts[column])
+
+    def __call__(self, dataset, columns=None, dtype=np.float64):
+        # pylint: disable=arguments-differ
         dataset = dataset.copy()
         columns = columns or dataset.columns
         for column in columns:
             self._validate_reference(column)
             self._validate_shape(dataset, column)
         for column in columns:
-            data = dataset[column]
-            data -= self._means[column]
-            data /= self._stds[column]
-            dataset[column] = data
+            dataset[column] = self.transform(dataset[column], column, dtype)
         return dataset
 
+    def transform(self, array, column, dtype=np.float64, out=None,
+                  chunk=2 ** 16):
+        """
+        Normalize the rows of an array by the statistics of a column. The
+        result is written into 'out' if provided, which may be the input
+        itself if writeable, for example a memory map opened for writing.
+        Otherwise, a new array of the given type is allocated. Rows are
+        processed in chunks to limit temporary memory.
+        """
+        if out is None:
+            out = np.empty(array.shape, dtype)
+        mean, std = self.mean(column), self.std(column)
+        for start in range(0, len(array), chunk):
+            rows = slice(start, start + chunk)
+            np.subtract(array[rows], mean, out=out[rows], casting='unsafe')
+            np.divide(out[rows], std, out=out[rows], casting='unsafe')
+        return out
+
+    def _combine(self, column, count, mean, squares):
+        if column not in self._means:
+            self._counts[column] = count
+            self._means[column] = mean
+            self._squares[column] = squares
+            return
+        if mean.shape != self._means[column].shape:
+            message = 'shape {} differs from {} in reference for column {}'
+            message = message.format(
+                mean.shape, self._means[column].shape, column)
+            raise ValueError(message)
+        # Combine partial statistics as proposed by Chan et al.
+        total = self._counts[column] + count
+        delta = mean - self._means[column]
+        self._means[column] = self._means[column] + delta * count / total
+        self._squares[column] = (
+            self._squares[column] + squares +
+            delta ** 2 * self._counts[column] * count / total)
+        self._counts[column] = total
+
     def _validate_reference(self, column):
         if column in self._means:
             return
@@ -41,7 +117,7 @@ class Normalize(Step):
         raise ValueError(message)
 
     def _validate_shape(self, dataset, column):
-        reference_shape = self._shapes[column]
+        reference_shape = self._means[column].shape
         dataset_shape = dataset[column].shape[1:]
         if reference_shape == dataset_shape:
             return
@@ -1,11 +1,133 @@
 import numpy as np
-from sets.core import Embedding
+from sets.core import Embedding, Lazy, Ragged
 
 
 class OneHot(Embedding):
 
-    def __init__(self, words, depth=1):
+    NULL = -1
+    UNKNOWN = -2
+
+    _derived = Embedding._derived + ('_uniform',)
+
+    def __init__(self, words, depth=1, sparse=False, dtype=np.float64):
+        """
+        Replace words by vectors with a one at their index in the sorted list
+        of distinct words. Rows of the identity matrix are computed when
+        looked up rather than stored. If 'sparse', columns are replaced by
+        the index of each word instead, or NULL for falsy words and UNKNOWN
+        for unknown words, and densify() converts batches of indices into
+        vectors.
+        """
         words = np.unique(np.sort(words))
-        embeddings = np.eye(len(words))
-        super().__init__(words, embeddings, depth)
+        super().__init__(words, _Identity(len(words), dtype), depth)
+        self._sparse = sparse
         assert self.shape == (len(words),)
+
+    def fallback(self, word):
+        # The average of the identity matrix.
+        if self._uniform is None:
+            self._uniform = np.full(self.shape, 1 / len(self._words))
+        return self._uniform
+
+    def _derive(self):
+        super()._derive()
+        self._uniform = None
+
+    def __call__(self, dataset, columns=None, return_found=False,
+                 vocabulary=None):
+        if not self._sparse:
+            return super().__call__(
+                dataset, columns, return_found, vocabulary)
+        dataset = dataset.copy()
+        columns = columns or dataset.columns
+        if vocabulary is not None:
+            codes = self._codes(vocabulary.words)
+            codes = np.concatenate([[self.NULL, self.UNKNOWN], codes])
+        found, overall = 0, 0
+        for column in columns:
+            data = dataset[column]
+            values = data.values if isinstance(data, Ragged) else data
+            if vocabulary is not None:
+                indices = codes[values]
+            elif isinstance(data, Ragged):
+                if self._depth < 2:
+                    message = 'ragged columns require a depth of two or more'
+                    raise ValueError(message)
+                indices = self._indices(values, self._depth - 1)
+            else:
+                indices = self._indices(values, self._depth)
+            found += np.count_nonzero(indices != self.UNKNOWN)
+            overall += indices.size
+            if isinstance(data, Ragged):
+                indices = data.with_values(indices)
+            dataset[column] = indices
+        if return_found:
+            return dataset, found / overall
+        return dataset
+
+    def densify(self, indices, dtype=None):
+        """
+        Convert indices produced in sparse mode into one-hot vectors, for
+        example one batch at a time. Falsy words become zero vectors and
+        unknown words the fallback vector.
+        """
+        if isinstance(indices, Ragged):
+            return indices.with_values(self.densify(indices.values, dtype))
+        indices = np.asarray(indices)
+        dense = np.zeros(indices.shape + self.shape, dtype or self.dtype)
+        dense[indices == self.UNKNOWN] = self.fallback(None)
+        positions = np.nonzero(indices >= 0)
+        dense[positions + (indices[positions],)] = 1
+        return dense
+
+    def _indices(self, array, depth):
+        words = array.reshape((-1,) + array.shape[depth:])
+        uniques, inverse = self._unique(words)
+        return self._codes(uniques)[inverse].reshape(array.shape[:depth])
+
+    def _codes(self, words):
+        """
+        Index of each word, or NULL for falsy and UNKNOWN for unknown words.
+        """
+        words = words.tolist() if words.ndim == 1 else list(words)
+        codes = np.empty(len(words), dtype=np.int32)
+        for position, word in enumerate(words):
+            index = self._index.get(self.key(word))
+            if index is None:
+                index = self.NULL if self._is_null(word) else self.UNKNOWN
+            codes[position] = index
+        return codes
+
+
+class _Identity(Lazy):
+    """
+    Identity matrix that computes its rows when indexed.
+    """
+
+    def __init__(self, size, dtype):
+        self._size = size
+        self._dtype = np.dtype(dtype)
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def shape(self):
+        return (self._size, self._size)
+
+    @property
+    def ndim(self):
+        return 2
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, key):
+        rows = np.arange(self._size)[key]
+        data = np.zeros(rows.shape + (self._size,), self._dtype)
+        np.put_along_axis(data, rows[..., None], 1, axis=-1)
+        return data
+
+    def materialize(self):
+        return np.eye(self._size, dtype=self._dtype)
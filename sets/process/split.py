@@ -1,9 +1,16 @@
+import numpy as np
 from sets.core import Step
 
 
 class Split(Step):
 
-    def __init__(self, *ratios):
+    def __init__(self, *ratios, shuffle=False, seed=None, stratify=None):
+        """
+        Split at one or more ratios. If 'shuffle', rows are assigned randomly
+        using the seed. If 'stratify' names a column, each of its distinct
+        values is split by the same ratios. Splits are views of the dataset
+        that only gather the rows of a column when it is accessed.
+        """
         ratios = ratios or 0.66
         ratios = ratios if hasattr(ratios, '__len__') else [ratios]
         ratios = [0] + list(ratios) + [1]
@@ -12,8 +19,104 @@ class Split(Step):
         if len(ratios) != len(set(ratios)):
             raise ValueError('ratios must be unique')
         self._ratios = ratios
+        self._shuffle = shuffle
+        self._seed = seed
+        self._stratify = stratify
 
     def __call__(self, dataset):
-        splits = [int(len(dataset) * x) for x in self._ratios]
-        for start, end in zip(splits[:-1], splits[1:]):
-            yield dataset[start:end]
+        if not self._shuffle and not self._stratify:
+            for start, end in self._bounds(len(dataset)):
+                yield dataset[start:end]
+            return
+        for indices in self.indices(dataset):
+            yield dataset.take(indices)
+
+    def indices(self, dataset):
+        """
+        Return one array of row indices per split.
+        """
+        random = np.random.RandomState(self._seed)
+        splits = [[] for _ in self._ratios[1:]]
+        for rows in _groups(dataset, self._stratify):
+            if self._shuffle:
+                rows = random.permutation(rows)
+            for split, (start, end) in zip(splits, self._bounds(len(rows))):
+                split.append(rows[start:end])
+        splits = [np.concatenate(x) for x in splits]
+        if self._shuffle:
+            return [random.permutation(x) for x in splits]
+        return [np.sort(x) for x in splits]
+
+    def _bounds(self, length):
+        splits = [int(length * x) for x in self._ratios]
+        return list(zip(splits[:-1], splits[1:]))
+
+
+class KFold(Step):
+
+    def __init__(self, folds=5, shuffle=False, seed=None, stratify=None):
+        """
+        Cross validation with the given number of folds. Options are the same
+        as for Split.
+        """
+        if folds < 2:
+            raise ValueError('need at least two folds')
+        self._folds = folds
+        self._shuffle = shuffle
+        self._seed = seed
+        self._stratify = stratify
+
+    def __call__(self, dataset):
+        """
+        Yield a pair of training and testing views for each fold.
+        """
+        for train, test in self.indices(dataset):
+            yield dataset.take(train), dataset.take(test)
+
+    def indices(self, dataset):
+        """
+        Return a pair of training and testing row indices for each fold.
+        """
+        assignments = self.assign(dataset)
+        folds = []
+        for fold in range(self._folds):
+            train = np.flatnonzero(assignments != fold)
+            test = np.flatnonzero(assignments == fold)
+            folds.append((train, test))
+        return folds
+
+    def assign(self, dataset):
+        """
+        Return the fold of each row. Folds differ in size by at most one row,
+        and by at most one row per distinct value if stratified.
+        """
+        random = np.random.RandomState(self._seed)
+        assignments = np.empty(len(dataset), dtype=np.int64)
+        offset = 0
+        for rows in _groups(dataset, self._stratify):
+            if self._shuffle:
+                rows = random.permutation(rows)
+            if self._stratify:
+                # Continue the round robin across groups to balance folds.
+                folds = (np.arange(len(rows)) + offset) % self._folds
+                offset += len(rows)
+            else:
+                folds = np.arange(len(rows)) * self._folds // len(rows)
+            assignments[rows] = folds
+        return assignments
+
+
+def _groups(dataset, column=None):
+    """
+    Yield the row indices of each distinct value in the column, or of all
+    rows if no column is given.
+    """
+    if not column:
+        yield np.arange(len(dataset))
+        return
+    values = dataset[column].reshape((len(dataset), -1))
+    _, labels = np.unique(values, axis=0, return_inverse=True)
+    labels = labels.reshape(-1)
+    order = np.argsort(labels, kind='stable')
+    bounds = np.flatnonzero(np.diff(labels[order])) + 1
+    yield from np.split(order, bounds)
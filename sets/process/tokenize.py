@@ -1,23 +1,52 @@
 import re
+from concurrent.futures import ProcessPoolExecutor
 import nltk
 import numpy as np
-from sets.core import Step
+from sets.core import Step, Ragged
 
 
 class Tokenize(Step):
 
     _regex_tag = re.compile(r'<[^>]+>')
 
+    def __init__(self, workers=None, chunk=None, ragged=False):
+        """
+        Tokenize columns in chunks of sentences distributed over a pool of
+        worker processes. By default, tokenize in the current process. The
+        default chunk size gives each worker a few chunks for balancing. If
+        'ragged', return Ragged columns instead of padding the sentences.
+        """
+        self._workers = workers
+        self._chunk = chunk
+        self._ragged = ragged
+
     def __call__(self, dataset, columns=None):
         # pylint: disable=arguments-differ
         dataset = dataset.copy()
         columns = columns or dataset.columns
         for column in columns:
-            tokens = [list(self._tokenize(x)) for x in dataset[column]]
-            padded = self._pad(tokens)
-            dataset[column] = padded
+            tokens = self._tokenize_all(dataset[column].tolist())
+            if self._ragged:
+                dataset[column] = Ragged.from_sequences(tokens, dtype=str)
+            else:
+                dataset[column] = self._pad(tokens)
         return dataset
 
+    def _tokenize_all(self, sentences):
+        if not self._workers or self._workers < 2:
+            return self._tokenize_chunk(sentences)
+        chunk = self._chunk or -(-len(sentences) // (4 * self._workers))
+        chunks = [
+            sentences[index:index + chunk]
+            for index in range(0, len(sentences), chunk)]
+        with ProcessPoolExecutor(self._workers) as executor:
+            results = executor.map(self._tokenize_chunk, chunks)
+            return [tokens for chunk in results for tokens in chunk]
+
+    @classmethod
+    def _tokenize_chunk(cls, sentences):
+        return [list(cls._tokenize(x)) for x in sentences]
+
     @classmethod
     def _tokenize(cls, sentence):
         """
@@ -0,0 +1,97 @@
+import numpy as np
+from sets.core import Step, Ragged
+
+
+class Vocabulary(Step):
+    """
+    Encode words as integer ids. The id 0 is used for padding and empty
+    words, 1 for unknown words, and the known words are numbered from 2 on
+    in sorted order. Embedding and OneHot can look up id columns directly
+    when passed the vocabulary that encoded them.
+    """
+
+    PADDING = 0
+    UNKNOWN = 1
+
+    def __init__(self, words, unknown='<unk>', dtype=np.int32):
+        """
+        Words is a list of known words. Empty words are dropped since they
+        are encoded as padding. The unknown word is what unknown ids decode
+        to.
+        """
+        words = np.unique(np.asarray(words))
+        self._words = words[words != '']
+        self._unknown = unknown
+        self._dtype = np.dtype(dtype)
+        if len(self) > np.iinfo(self._dtype).max:
+            raise ValueError('too many words for ids of type {}'.format(
+                self._dtype))
+
+    @classmethod
+    def fit(cls, dataset, columns=None, min_count=1, **kwargs):
+        """
+        Build the vocabulary of words that occur at least 'min_count' times
+        in the columns of a dataset. Further arguments are passed to the
+        constructor.
+        """
+        columns = columns or dataset.columns
+        words, counts = [], []
+        for column in columns:
+            data = dataset[column]
+            data = data.values if isinstance(data, Ragged) else data
+            uniques, count = np.unique(data, return_counts=True)
+            words.append(uniques)
+            counts.append(count)
+        words, inverse = np.unique(np.concatenate(words), return_inverse=True)
+        counts = np.bincount(
+            inverse.reshape(-1), weights=np.concatenate(counts))
+        return cls(words[counts >= min_count], **kwargs)
+
+    @property
+    def words(self):
+        return self._words
+
+    def __len__(self):
+        """
+        Number of ids including padding and unknown.
+        """
+        return len(self._words) + 2
+
+    def __contains__(self, word):
+        return bool(self.encode(np.asarray([word]))[0] > self.UNKNOWN)
+
+    def __call__(self, dataset, columns=None):
+        # pylint: disable=arguments-differ
+        dataset = dataset.copy()
+        columns = columns or dataset.columns
+        for column in columns:
+            data = dataset[column]
+            if isinstance(data, Ragged):
+                dataset[column] = data.with_values(self.encode(data.values))
+            else:
+                dataset[column] = self.encode(data)
+        return dataset
+
+    def encode(self, array):
+        """
+        Ids of the words in an array of any shape, found by binary search
+        over the sorted words.
+        """
+        array = np.asarray(array)
+        ids = np.full(array.shape, self.UNKNOWN, dtype=self._dtype)
+        if len(self._words):
+            positions = np.searchsorted(self._words, array)
+            positions = np.minimum(positions, len(self._words) - 1)
+            known = self._words[positions] == array
+            ids[known] = positions[known] + 2
+        ids[array == ''] = self.PADDING
+        return ids
+
+    def decode(self, ids):
+        """
+        Words of an array of ids. Padding decodes to the empty string.
+        """
+        if isinstance(ids, Ragged):
+            return ids.with_values(self.decode(ids.values))
+        words = np.concatenate([['', self._unknown], self._words])
+        return words[np.asarray(ids)]
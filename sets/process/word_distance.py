@@ -1,11 +1,16 @@
 import warnings
 import numpy as np
-from sets.core import Step
+from sets.core import Step, Ragged
 
 
 class WordDistance(Step):
 
     def __init__(self, *tags, depth=2):
+        """
+        Tags are the words to compute offsets to. Depth is the number of
+        dimensions of rows and sequence positions. All further dimensions are
+        considered part of the word.
+        """
         self._tags = tags
         self._depth = depth
 
@@ -14,23 +19,58 @@ class WordDistance(Step):
         dataset = dataset.copy()
         if 'word_distance' in dataset.columns:
             warnings.warn('override existing column word_distance')
-        array_shape = dataset[column].shape[:self._depth]
-        data = np.empty(array_shape + (len(self._tags),))
-        for index, words in enumerate(dataset[column]):
-            positions = self._positions(words)
-            data[index] = self._relative_sequence(positions, len(words))
-        dataset['word_distance'] = data
+        tokens = dataset[column]
+        if isinstance(tokens, Ragged):
+            dataset['word_distance'] = self._ragged_distances(tokens)
+        else:
+            dataset['word_distance'] = self._distances(tokens)
         return dataset
 
-    def _positions(self, tokens):
-        if not all(x in tokens for x in self._tags):
-            raise ValueError('a tag was not found')
-        return [np.where(tokens == x)[0][0] for x in self._tags]
-
-    @staticmethod
-    def _relative_sequence(positions, length):
-        sequence = np.empty((length, len(positions)))
-        for index, position in enumerate(positions):
-            for current in range(length):
-                sequence[current][index] = index - position
-        return sequence
+    def _distances(self, tokens):
+        """
+        Offsets of all sequence positions to the first occurrence of each
+        tag, in the shape of rows, positions and tags.
+        """
+        matches = self._matches(tokens, self._depth)
+        self._validate(matches.any(axis=1))
+        positions = matches.argmax(axis=1)
+        sequence = np.arange(tokens.shape[1])
+        distances = sequence[None, :, None] - positions[:, None, :]
+        return distances.astype(float)
+
+    def _ragged_distances(self, tokens):
+        matches = self._matches(tokens.values, self._depth - 1)
+        rows = np.repeat(np.arange(len(tokens)), tokens.lengths)
+        sequence = np.arange(len(rows)) - tokens.offsets[rows]
+        positions = np.full((len(tokens), len(self._tags)), -1)
+        for index in range(len(self._tags)):
+            hits = np.flatnonzero(matches[:, index])
+            found, first = np.unique(rows[hits], return_index=True)
+            positions[found, index] = sequence[hits[first]]
+        self._validate(positions >= 0)
+        distances = sequence[:, None] - positions[rows]
+        return tokens.with_values(distances.astype(float))
+
+    def _matches(self, tokens, depth):
+        """
+        Boolean array of whether each word equals each tag, with the tags
+        along a new last dimension.
+        """
+        matches = []
+        for tag in self._tags:
+            match = tokens == tag
+            if match.ndim > depth:
+                match = match.all(axis=tuple(range(depth, match.ndim)))
+            matches.append(match)
+        return np.stack(matches, axis=-1)
+
+    def _validate(self, found, limit=10):
+        if found.all():
+            return
+        rows, tags = np.nonzero(~found)
+        missing = [
+            'row {} lacks {}'.format(row, self._tags[tag])
+            for row, tag in zip(rows[:limit], tags[:limit])]
+        if len(rows) > limit:
+            missing.append('and {} more'.format(len(rows) - limit))
+        raise ValueError('tags not found: ' + ', '.join(missing))
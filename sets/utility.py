@@ -3,8 +3,22 @@ import pickle
 import functools
 import errno
 import shutil
-from urllib.request import urlopen
+import hashlib
+import tempfile
+import contextlib
+import types
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+import numpy as np
 import definitions
+from sets.core.dataset import Dataset
+from sets.core.ragged import Ragged
+from sets.core import storage
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 def read_config(schema='data/schema.yaml', name='sets'):
     filename = '.{}rc'.format(name)
@@ -20,12 +34,22 @@ def read_config(schema='data/schema.yaml', name='sets'):
             return parser(path)
     return parser('{}')
 
-def disk_cache(basename, directory, method=False):
+def disk_cache(basename, directory, method=False, max_size=None, root=None,
+               store=False):
     """
     Function decorator for caching pickleable return values on disk. Uses a
-    hash computed from the function arguments for invalidation. If 'method',
-    skip the first argument, usually being self or cls. The cache filepath is
-    'directory/basename-hash.pickle'.
+    fingerprint computed from the function arguments for invalidation. If
+    'method', skip the first argument, usually being self or cls. The cache
+    filepath is 'directory/basename-fingerprint.pickle'. Datasets are instead
+    stored in the columnar format at 'directory/basename-fingerprint' and
+    loaded as memory maps. Entries are written under a temporary name and
+    renamed when complete, and a lock file keeps concurrent processes from
+    computing the same entry twice. If 'max_size' is set, the least recently
+    used entries inside 'root', defaulting to the directory, are evicted until
+    their total size is at most that many bytes. If 'store', the function
+    writes the dataset itself, for example using a DatasetWriter, into the
+    directory passed as its first argument, which is not part of the
+    fingerprint.
     """
     directory = os.path.expanduser(directory)
     ensure_directory(directory)
@@ -33,30 +57,393 @@ def disk_cache(basename, directory, method=False):
     def wrapper(func):
         @functools.wraps(func)
         def wrapped(*args, **kwargs):
-            key = (tuple(args), tuple(kwargs.items()))
             # Don't use self or cls for the invalidation hash.
-            if method and key:
-                key = key[1:]
-            # Only use positive hash to avoid double dash filenames
-            identifier = abs(hash(key))
-            filename = '{}-{}.pickle'.format(basename, identifier)
+            key = (args[1:] if method else args, sorted(kwargs.items()))
+            filename = '{}-{}'.format(basename, fingerprint(key))
             filepath = os.path.join(directory, filename)
-            if os.path.isfile(filepath):
-                with open(filepath, 'rb') as handle:
-                    return pickle.load(handle)
-            result = func(*args, **kwargs)
-            with open(filepath, 'wb') as handle:
-                pickle.dump(result, handle)
+            with _lock(filepath + '.lock'):
+                found, result = _read_cache(filepath)
+                if found:
+                    return result
+                if store:
+                    func(filepath, *args, **kwargs)
+                    result = Dataset.open(filepath)
+                else:
+                    result = func(*args, **kwargs)
+                    _write_cache(filepath, result)
+            if max_size:
+                evict_cache(root or directory, max_size)
+            if isinstance(result, Dataset) and storage.is_stored(filepath):
+                return Dataset.open(filepath)
             return result
         return wrapped
 
     return wrapper
 
-def download(url, directory, filename=None):
+def evict_cache(directory, max_size):
+    """
+    Remove the least recently used cache entries inside the directory tree
+    until their total size is at most 'max_size' bytes. Only entries written
+    by disk_cache() are considered, other files like downloads are kept.
+    """
+    entries = sorted(_cache_entries(os.path.expanduser(directory)))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+        if total <= max_size:
+            break
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.isfile(path):
+            os.remove(path)
+        total -= size
+
+def fingerprint(value):
+    """
+    Hexadecimal digest of a value that, unlike the builtin hash() of strings,
+    is the same in every process. Supports nested containers, Numpy arrays,
+    ragged arrays, datasets, functions and objects like steps by their type
+    and attributes, and falls back to pickling for other values.
+    """
+    hash_ = hashlib.sha1()
+    _update_fingerprint(hash_, value)
+    return hash_.hexdigest()
+
+def _update_fingerprint(hash_, value):
+    if isinstance(value, (tuple, list)):
+        header = '{}:{};'.format(type(value).__name__, len(value))
+        hash_.update(header.encode())
+        for element in value:
+            _update_fingerprint(hash_, element)
+    elif isinstance(value, dict):
+        hash_.update('dict:{};'.format(len(value)).encode())
+        for key, element in sorted(
+                (fingerprint(k), v) for k, v in value.items()):
+            hash_.update(key.encode())
+            _update_fingerprint(hash_, element)
+    elif isinstance(value, (set, frozenset)):
+        # Sets iterate in an order that depends on the hash seed.
+        header = '{}:{};'.format(type(value).__name__, len(value))
+        hash_.update(header.encode())
+        for element in sorted(fingerprint(x) for x in value):
+            hash_.update(element.encode())
+    elif isinstance(value, Dataset):
+        _update_fingerprint(hash_, {x: value[x] for x in value.columns})
+    elif isinstance(value, Ragged):
+        hash_.update('{};'.format(type(value).__name__.lower()).encode())
+        _update_fingerprint(hash_, (value.values, value.offsets))
+    elif isinstance(value, np.ndarray):
+        header = 'ndarray:{}:{};'.format(value.dtype.str, value.shape)
+        hash_.update(header.encode())
+        if value.dtype.hasobject:
+            _update_fingerprint(hash_, value.tolist())
+        else:
+            hash_.update(np.ascontiguousarray(value).data)
+    elif value is None or isinstance(value, (str, bytes, int, float)):
+        hash_.update('{}:{!r};'.format(type(value).__name__, value).encode())
+    elif isinstance(value, functools.partial):
+        hash_.update(b'partial;')
+        _update_fingerprint(hash_, (value.func, value.args, value.keywords))
+    elif isinstance(value, types.MethodType):
+        hash_.update(b'method;')
+        _update_fingerprint(hash_, (value.__self__, value.__func__))
+    elif isinstance(value, types.FunctionType):
+        hash_.update('function:{};'.format(_qualname(value)).encode())
+        _update_code(hash_, value.__code__)
+        cells = [x.cell_contents for x in value.__closure__ or ()]
+        _update_fingerprint(hash_, (value.__defaults__, cells))
+        _update_globals(hash_, value)
+    elif hasattr(value, '__dict__') and not isinstance(value, type):
+        hash_.update('object:{};'.format(_qualname(type(value))).encode())
+        _update_fingerprint(hash_, _state(value))
+    else:
+        hash_.update(pickle.dumps(value))
+
+def _update_code(hash_, code):
+    """
+    Hash the instructions, constants and referenced names of a code object,
+    including nested functions and comprehensions.
+    """
+    hash_.update(code.co_code)
+    hash_.update(repr(code.co_names).encode())
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            _update_code(hash_, constant)
+        else:
+            _update_fingerprint(hash_, constant)
+
+def _update_globals(hash_, function):
+    """
+    Hash the module level values a function refers to. Referenced functions
+    are hashed by their code, modules and classes by their names, and data
+    by its value.
+    """
+    for name in sorted(_global_names(function.__code__)):
+        if name not in function.__globals__:
+            continue
+        value = function.__globals__[name]
+        hash_.update('global:{};'.format(name).encode())
+        if isinstance(value, types.FunctionType):
+            _update_code(hash_, value.__code__)
+        elif isinstance(value, types.ModuleType):
+            hash_.update(value.__name__.encode())
+        elif isinstance(value, type):
+            hash_.update(_qualname(value).encode())
+        elif value is None or isinstance(value, (
+                str, bytes, int, float, tuple, list, dict, set, frozenset,
+                np.ndarray)):
+            _update_fingerprint(hash_, value)
+        else:
+            hash_.update(_qualname(type(value)).encode())
+
+def _global_names(code):
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            names |= _global_names(constant)
+    return names
+
+def _state(value):
+    """
+    The attributes of an object, or the state it defines for pickling.
+    """
+    default = getattr(object, '__getstate__', None)
+    if getattr(type(value), '__getstate__', default) is not default:
+        return value.__getstate__()
+    return vars(value)
+
+def _qualname(value):
+    return '{}.{}'.format(value.__module__, value.__qualname__)
+
+def _read_cache(filepath):
+    if storage.is_stored(filepath):
+        os.utime(filepath)
+        return True, Dataset.open(filepath)
+    if os.path.isfile(filepath + '.pickle'):
+        os.utime(filepath + '.pickle')
+        with open(filepath + '.pickle', 'rb') as handle:
+            return True, pickle.load(handle)
+    return False, None
+
+def _write_cache(filepath, result):
+    directory, filename = os.path.split(filepath)
+    if _is_storable(result):
+        temp = tempfile.mkdtemp(prefix='.' + filename, dir=directory)
+        try:
+            result.save(temp)
+            os.rename(temp, filepath)
+        except BaseException:
+            shutil.rmtree(temp, ignore_errors=True)
+            raise
+        return
+    handle, temp = tempfile.mkstemp(prefix='.' + filename, dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as file_:
+            pickle.dump(result, file_)
+        os.replace(temp, filepath + '.pickle')
+    except BaseException:
+        os.remove(temp)
+        raise
+
+def _is_storable(result):
+    if not isinstance(result, Dataset):
+        return False
+    return not any(result[x].dtype.hasobject for x in result.columns)
+
+def _cache_entries(directory):
+    """
+    Yield modification time, size and path of all cache entries inside the
+    directory tree. Hidden files are temporary and not yet complete.
+    """
+    for root, dirnames, filenames in os.walk(directory):
+        dirnames[:] = [x for x in dirnames if not x.startswith('.')]
+        if root != directory and storage.is_stored(root):
+            dirnames[:] = []
+            yield os.path.getmtime(root), _directory_size(root), root
+            continue
+        for filename in filenames:
+            if filename.startswith('.') or not filename.endswith('.pickle'):
+                continue
+            path = os.path.join(root, filename)
+            yield os.path.getmtime(path), os.path.getsize(path), path
+
+def _directory_size(directory):
+    """
+    Total size of the files inside the directory tree, including the chunks
+    of stores written by DatasetWriter.
+    """
+    size = 0
+    for root, _, filenames in os.walk(directory):
+        size += sum(os.path.getsize(os.path.join(root, x)) for x in filenames)
+    return size
+
+def _range_size(url):
+    """
+    Size and validator, like the ETag, of the resource if the server supports
+    range requests, else None for both.
+    """
+    with urlopen(Request(url, method='HEAD')) as response:
+        if response.headers.get('Accept-Ranges') != 'bytes':
+            return None, None
+        size = response.headers.get('Content-Length')
+        validator = _validator(response.headers)
+    return (int(size), validator) if size else (None, None)
+
+def _fetch_segments(url, filepath, size, validator, segments):
+    """
+    Download equally sized byte ranges into separate partial files in
+    parallel and join them once all are complete. Segments of an earlier
+    attempt are only continued if the validator of the whole resource is
+    unchanged. If the server does not send a requested range, for example
+    because the resource changed meanwhile, the segments are discarded and
+    the whole resource is downloaded at once.
+    """
+    bounds = [size * x // segments for x in range(segments + 1)]
+    paths = ['{}.{}'.format(filepath, x) for x in range(segments)]
+    if not validator or _read_validator(filepath) != validator:
+        for path in paths + [filepath]:
+            _remove_partial(path)
+        _write_validator(filepath, validator)
+    try:
+        with ThreadPoolExecutor(segments) as executor:
+            futures = [
+                executor.submit(_fetch, url, path, start, end, validator)
+                for path, start, end in zip(paths, bounds[:-1], bounds[1:])]
+            for future in futures:
+                future.result()
+    except ValueError:
+        for path in paths + [filepath]:
+            _remove_partial(path)
+        _fetch(url, filepath)
+        return
+    with open(filepath, 'wb') as file_:
+        for path in paths:
+            with open(path, 'rb') as segment:
+                shutil.copyfileobj(segment, file_)
+    for path in paths:
+        _remove_partial(path)
+
+def _fetch(url, filepath, start=0, end=None, validator=None,
+           chunk=2 ** 20):
+    """
+    Download the bytes from start to end of the url into the file, continuing
+    after the bytes that are already there. The ETag or modification date of
+    the first response is kept next to the file, so that the server sends the
+    whole file again instead of a range if it changed since. Segments ending
+    before the end of the file instead use the given validator of the whole
+    resource and raise an error if the server does not send their range.
+    """
+    offset = os.path.getsize(filepath) if os.path.isfile(filepath) else 0
+    if end is not None and start + offset >= end:
+        return
+    if end is None:
+        validator = _read_validator(filepath) if offset else None
+    request = Request(url)
+    if start + offset or end is not None:
+        last = '' if end is None else end - 1
+        request.add_header('Range', 'bytes={}-{}'.format(start + offset, last))
+        if validator:
+            request.add_header('If-Range', validator)
+    try:
+        response = urlopen(request)
+    except HTTPError as error:
+        if error.code != 416 or not offset or end is not None:
+            raise
+        # The requested range starts at the end of the file. Only accept the
+        # partial file if it has exactly the size of the remote file.
+        if _content_range_size(error.headers) == offset:
+            return
+        _remove_partial(filepath)
+        return _fetch(url, filepath, start, end, chunk=chunk)
+    with response:
+        if response.status != 206:
+            if start or end is not None:
+                raise ValueError('server did not send the requested range')
+            offset = 0
+        if end is None and not offset:
+            _write_validator(filepath, _validator(response.headers))
+        with open(filepath, 'ab' if offset else 'wb') as file_:
+            shutil.copyfileobj(response, file_, chunk)
+
+def _content_range_size(headers):
+    """
+    Total size of the resource from a Content-Range header like 'bytes
+    */1234' or 'bytes 0-99/1234', or None if unknown.
+    """
+    total = (headers.get('Content-Range') or '').rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+def _read_validator(filepath):
+    try:
+        with open(filepath + '.validator') as file_:
+            return file_.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def _validator(headers):
+    # Weak ETags cannot be used to resume ranges.
+    validator = headers.get('ETag')
+    if not validator or validator.startswith('W/'):
+        validator = headers.get('Last-Modified')
+    return validator
+
+def _write_validator(filepath, validator):
+    if validator:
+        with open(filepath + '.validator', 'w') as file_:
+            file_.write(validator)
+    elif os.path.isfile(filepath + '.validator'):
+        os.remove(filepath + '.validator')
+
+def _remove_partial(filepath):
+    for path in (filepath, filepath + '.validator'):
+        if os.path.isfile(path):
+            os.remove(path)
+
+def _checksum(filepath, algorithm, chunk=2 ** 20):
+    hash_ = hashlib.new(algorithm)
+    with open(filepath, 'rb') as file_:
+        for block in iter(lambda: file_.read(chunk), b''):
+            hash_.update(block)
+    return hash_.hexdigest()
+
+@contextlib.contextmanager
+def _lock(filepath):
+    """
+    Hold an exclusive lock on the file for the duration of the context and
+    remove the file afterwards. Without fcntl, for example on Windows, no
+    locking is performed.
+    """
+    if not fcntl:
+        yield
+        return
+    while True:
+        file_ = open(filepath, 'a')
+        fcntl.flock(file_, fcntl.LOCK_EX)
+        # The previous holder may have removed the file meanwhile.
+        try:
+            if os.fstat(file_.fileno()).st_ino == os.stat(filepath).st_ino:
+                break
+        except FileNotFoundError:
+            pass
+        file_.close()
+    try:
+        yield
+    finally:
+        os.remove(filepath)
+        file_.close()
+
+def download(url, directory, filename=None, segments=1, checksum=None,
+             algorithm='sha256'):
     """
     Download a file and return its filename on the local file system. If the
     file is already there, it will not be downloaded again. The filename is
     derived from the url if not provided. Return the filepath.
+
+    Data is written into a partial file next to the destination and only
+    renamed once complete, so that interrupted downloads continue where they
+    stopped. If the server supports ranges, large files can be downloaded as
+    multiple segments in parallel. If a hexadecimal checksum of the given
+    hash algorithm is provided, a mismatching download is removed and raises
+    an error.
     """
     if not filename:
         _, filename = os.path.split(url)
@@ -66,10 +453,46 @@ def download(url, directory, filename=None):
     if os.path.isfile(filepath):
         return filepath
     print('Download', filepath)
-    with urlopen(url) as response, open(filepath, 'wb') as file_:
-        shutil.copyfileobj(response, file_)
+    partial = filepath + '.part'
+    size, validator = _range_size(url) if segments > 1 else (None, None)
+    if size:
+        _fetch_segments(url, partial, size, validator, segments)
+    else:
+        _fetch(url, partial)
+    if checksum and _checksum(partial, algorithm) != checksum.lower():
+        _remove_partial(partial)
+        message = '{} checksum of {} does not match {}'
+        raise ValueError(message.format(algorithm, url, checksum))
+    os.replace(partial, filepath)
+    _remove_partial(partial)
     return filepath
 
+def download_all(urls, directory, filenames=None, workers=4, progress=None,
+                 **kwargs):
+    """
+    Download multiple files concurrently using a bounded number of threads
+    and return their filepaths in the order of the urls. Files that are
+    already there are not downloaded again. If provided, progress is called
+    with the number of completed files, the total number of files and the
+    filepath after each download. Further arguments are passed to download().
+    """
+    urls = list(urls)
+    filenames = filenames or [None] * len(urls)
+    if len(filenames) != len(urls):
+        raise ValueError('need one filename per url')
+    filepaths = [None] * len(urls)
+    with ThreadPoolExecutor(max(1, min(workers, len(urls)))) as executor:
+        futures = {}
+        for index, (url, filename) in enumerate(zip(urls, filenames)):
+            future = executor.submit(
+                download, url, directory, filename, **kwargs)
+            futures[future] = index
+        for done, future in enumerate(as_completed(futures), 1):
+            filepaths[futures[future]] = future.result()
+            if progress:
+                progress(done, len(urls), filepaths[futures[future]])
+    return filepaths
+
 def ensure_directory(directory):
     """
     Create the directories along the provided directory path that do not exist.
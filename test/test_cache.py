@@ -1,5 +1,12 @@
 # pylint: disable=no-self-use
+import os
+import sys
+import collections
+import time
+import threading
+import subprocess
 from os import listdir
+import numpy as np
 import sets
 
 
@@ -46,3 +53,194 @@ class TestDiskCache:
         dummy(None, "foo")
         dummy(None, "foo", kwarg=True)
         assert(2 == len(listdir(str(tmpdir))))
+
+    def test_dataset_memory_mapped(self, tmpdir):
+        @sets.disk_cache('foo', str(tmpdir))
+        def pipeline():
+            return sets.Dataset(data=np.arange(10))
+        first = pipeline()
+        second = pipeline()
+        assert first == second
+        assert isinstance(second['data'], np.memmap)
+
+    def test_string_argument_stable_across_processes(self, tmpdir):
+        script = (
+            'import sets\n'
+            '@sets.disk_cache("foo", {!r})\n'
+            'def pipeline(argument):\n'
+            '    print("called")\n'
+            'pipeline("argument")\n').format(str(tmpdir))
+        outputs = []
+        for seed in ('1', '2'):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            outputs.append(subprocess.check_output(
+                [sys.executable, '-c', script], env=env))
+        assert outputs == [b'called\n', b'']
+
+    def test_set_argument_stable_across_processes(self, tmpdir):
+        script = (
+            'import sets\n'
+            '@sets.disk_cache("foo", {!r})\n'
+            'def pipeline(argument):\n'
+            '    print("called")\n'
+            'pipeline({{"the", "a", frozenset("of")}})\n').format(str(tmpdir))
+        outputs = []
+        for seed in ('1', '2', '3'):
+            env = dict(os.environ, PYTHONHASHSEED=seed)
+            outputs.append(subprocess.check_output(
+                [sys.executable, '-c', script], env=env))
+        assert outputs == [b'called\n', b'', b'']
+
+    def test_method_ignores_first_argument_only(self, tmpdir):
+        @sets.disk_cache('foo', str(tmpdir), method=True)
+        def pipeline(self, argument):
+            # pylint: disable=unused-argument
+            return argument
+        assert pipeline(None, 1) == 1
+        assert pipeline(None, 2) == 2
+        assert pipeline('other', 2) == 2
+
+    def test_no_temporary_files(self, tmpdir):
+        @sets.disk_cache('foo', str(tmpdir))
+        def pipeline():
+            return sets.Dataset(data=np.arange(10))
+        pipeline()
+        assert not [x for x in listdir(str(tmpdir)) if x.startswith('.')]
+
+    def test_concurrent_calls_compute_once(self, tmpdir):
+        called = 0
+        @sets.disk_cache('foo', str(tmpdir))
+        def pipeline():
+            nonlocal called
+            called += 1
+            time.sleep(0.1)
+            return 'Foo'
+        threads = [threading.Thread(target=pipeline) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert called == 1
+
+    def test_evict_least_recently_used(self, tmpdir):
+        @sets.disk_cache('foo', str(tmpdir), max_size=2500)
+        def pipeline(argument):
+            return sets.Dataset(data=np.zeros(100) + argument)
+        pipeline(1)
+        pipeline(2)
+        pipeline(1)
+        pipeline(3)
+        assert len(listdir(str(tmpdir))) == 2
+        called = []
+        @sets.disk_cache('foo', str(tmpdir), max_size=2500)
+        def pipeline(argument):
+            called.append(argument)
+            return sets.Dataset(data=np.zeros(100) + argument)
+        pipeline(1)
+        pipeline(3)
+        assert called == []
+        pipeline(2)
+        assert called == [2]
+
+    def test_store_written_once_and_evicted(self, tmpdir):
+        called = []
+        @sets.disk_cache('foo', str(tmpdir), max_size=2000, store=True)
+        def pipeline(directory, argument):
+            called.append(argument)
+            time.sleep(0.1)
+            with sets.DatasetWriter(directory, chunk_size=50) as writer:
+                writer.extend(data=np.zeros(100) + argument)
+        threads = [
+            threading.Thread(target=pipeline, args=(1,)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert called == [1]
+        assert pipeline(1).data.tolist() == [1] * 100
+        pipeline(2)
+        pipeline(3)
+        assert len(listdir(str(tmpdir))) == 1
+        assert pipeline(3).data.tolist() == [3] * 100
+        assert called == [1, 2, 3]
+
+    def test_fingerprint_distinguishes_types(self):
+        assert sets.fingerprint(1) != sets.fingerprint('1')
+        assert sets.fingerprint([1]) != sets.fingerprint((1,))
+        assert sets.fingerprint({'a': 1, 'b': 2}) == \
+            sets.fingerprint({'b': 2, 'a': 1})
+        assert sets.fingerprint(np.zeros(3)) == sets.fingerprint(np.zeros(3))
+        assert sets.fingerprint(np.zeros(3)) != sets.fingerprint(np.ones(3))
+
+    def test_fingerprint_function_constants(self):
+        source = 'def scale(dataset):\n    return dataset.data * {}\n'
+        first, second = {}, {}
+        exec(source.format(2), first)  # pylint: disable=exec-used
+        exec(source.format(5), second)  # pylint: disable=exec-used
+        assert sets.fingerprint(first['scale']) != \
+            sets.fingerprint(second['scale'])
+
+    def test_fingerprint_bound_methods(self):
+        assert sets.fingerprint(Counter(1).__call__) != \
+            sets.fingerprint(Counter(2).__call__)
+        assert sets.fingerprint(Counter(1).__call__) == \
+            sets.fingerprint(Counter(1).__call__)
+
+
+class Counter(sets.Step):
+
+    # Not an attribute since that would change the fingerprint of the step.
+    calls = collections.Counter()
+
+    def __init__(self, amount):
+        self.amount = amount
+
+    def __call__(self, dataset, columns=None):
+        type(self).calls[self.amount] += 1
+        dataset = dataset.copy()
+        for column in columns or dataset.columns:
+            dataset[column] = dataset[column] + self.amount
+        return dataset
+
+
+class TestPipeline:
+
+    def test_result(self, tmpdir):
+        dataset = sets.Dataset(data=np.arange(5), other=np.zeros(5))
+        pipeline = sets.Pipeline(str(tmpdir))
+        pipeline.add(Counter(1), columns=['data']).add(Counter(2))
+        result = pipeline(dataset)
+        assert result.data.tolist() == [3, 4, 5, 6, 7]
+        assert result.other.tolist() == [2] * 5
+
+    def test_only_changed_stages_run(self, tmpdir):
+        Counter.calls.clear()
+        dataset = sets.Dataset(data=np.arange(5))
+        first, second, third = Counter(1), Counter(2), Counter(3)
+        sets.Pipeline(str(tmpdir)).add(first).add(second)(dataset)
+        assert Counter.calls == {1: 1, 2: 1}
+        sets.Pipeline(str(tmpdir)).add(first).add(second)(dataset)
+        assert Counter.calls == {1: 1, 2: 1}
+        result = sets.Pipeline(str(tmpdir)).add(first).add(third)(dataset)
+        assert Counter.calls == {1: 1, 2: 1, 3: 1}
+        assert result.data.tolist() == [4, 5, 6, 7, 8]
+        sets.Pipeline(str(tmpdir)).add(first).add(second)(dataset[1:])
+        assert Counter.calls == {1: 2, 2: 2, 3: 1}
+
+    def test_changed_function_constant_reruns(self, tmpdir):
+        source = (
+            'def scale(dataset):\n'
+            '    return sets.Dataset(data=dataset.data * {})\n')
+        dataset = sets.Dataset(data=np.arange(3))
+        for factor in (2, 5):
+            namespace = {'sets': sets}
+            exec(source.format(factor), namespace)  # pylint: disable=exec-used
+            pipeline = sets.Pipeline(str(tmpdir)).add(namespace['scale'])
+            assert pipeline(dataset).data.tolist() == [0, factor, 2 * factor]
+
+    def test_fused_stages_not_stored(self, tmpdir):
+        dataset = sets.Dataset(data=np.arange(5))
+        pipeline = sets.Pipeline(str(tmpdir))
+        pipeline.add(Counter(1), cache=False).add(Counter(2))
+        pipeline(dataset)
+        assert len(listdir(str(tmpdir))) == 1
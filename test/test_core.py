@@ -2,7 +2,8 @@
 import pickle
 import numpy as np
 import pytest
-from sets import Dataset
+from sets import (
+    Dataset, Ragged, Text, DatasetWriter, Concatenation, Take)
 
 
 @pytest.fixture
@@ -26,7 +27,273 @@ class TestDataset:
     def test_sample(self, dataset):
         dataset.sample(2)
 
+    def test_sample_is_lazy(self, dataset):
+        sample = dataset.sample(2, seed=0)
+        assert all(isinstance(sample._data[x], Take) for x in sample.columns)
+        assert sample == dataset.sample(2, seed=0)
+        assert len(set(sample['numbers'].tolist())) == 2
+
     def test_pickle(self, dataset):
         dumped = pickle.dumps(dataset)
         loaded = pickle.loads(dumped)
         assert loaded == dataset
+
+    def test_column_is_read_only_view(self, dataset):
+        column = dataset['arrays']
+        assert not column.flags.writeable
+        assert np.shares_memory(column, dataset['arrays'])
+        with pytest.raises(ValueError):
+            column[0] = 1
+
+    def test_copy_shares_columns(self, dataset):
+        copy = dataset.copy()
+        assert np.shares_memory(copy['arrays'], dataset['arrays'])
+        copy['arrays'] = np.zeros((3, 2))
+        assert not np.shares_memory(copy['arrays'], dataset['arrays'])
+        assert dataset['arrays'].any()
+
+    def test_slice_shares_columns(self, dataset):
+        assert np.shares_memory(dataset[1:]['arrays'], dataset['arrays'])
+
+    def test_writeable_input_is_copied(self):
+        data = np.zeros(3)
+        dataset = Dataset(data=data)
+        data[0] = 1
+        assert not dataset['data'].any()
+
+    def test_frozen_input_is_shared(self):
+        data = np.zeros(3)
+        data.setflags(write=False)
+        dataset = Dataset(data=data)
+        assert np.shares_memory(dataset['data'], data)
+
+    @pytest.mark.parametrize('mmap', [True, False])
+    def test_save_and_open(self, dataset, tmpdir, mmap):
+        directory = str(tmpdir.join('dataset'))
+        dataset.save(directory)
+        loaded = Dataset.open(directory, mmap=mmap)
+        assert loaded == dataset
+        assert loaded['strings'].dtype == dataset['strings'].dtype
+        assert isinstance(loaded['arrays'], np.memmap) == mmap
+        assert not loaded['arrays'].flags.writeable
+
+    def test_save_object_column(self, tmpdir):
+        dataset = Dataset(data=np.array([None, 1], dtype=object))
+        with pytest.raises(ValueError):
+            dataset.save(str(tmpdir))
+
+
+class TestText:
+
+    def test_rows_are_strings(self):
+        text = Text.from_strings(['hello', '', 'wörld'])
+        assert len(text) == 3
+        assert text[2] == 'wörld'
+        assert list(text) == ['hello', '', 'wörld']
+        assert text[1:].tolist() == ['', 'wörld']
+        assert text[[2, 0]].tolist() == ['wörld', 'hello']
+        assert (np.asarray(text) == ['hello', '', 'wörld']).all()
+
+    def test_save_and_open(self, tmpdir):
+        dataset = Dataset(text=Text.from_strings(['a', 'bc']))
+        dataset.save(str(tmpdir))
+        loaded = Dataset.open(str(tmpdir))
+        assert isinstance(loaded.text, Text)
+        assert loaded == dataset
+
+
+@pytest.fixture
+def ragged():
+    return Ragged.from_sequences([[1, 2, 3], [], [4], [5, 6]])
+
+
+class TestRagged:
+
+    def test_rows(self, ragged):
+        assert len(ragged) == 4
+        assert ragged.lengths.tolist() == [3, 0, 1, 2]
+        assert [x.tolist() for x in ragged] == [[1, 2, 3], [], [4], [5, 6]]
+        assert ragged[-1].tolist() == [5, 6]
+
+    def test_slice_shares_values(self, ragged):
+        part = ragged[1:3]
+        assert [x.tolist() for x in part] == [[], [4]]
+        assert np.shares_memory(part.values, ragged.values)
+
+    def test_fancy_index(self, ragged):
+        part = ragged[[3, 0, 3]]
+        assert [x.tolist() for x in part] == [[5, 6], [1, 2, 3], [5, 6]]
+        part = ragged[np.array([False, True, True, False])]
+        assert [x.tolist() for x in part] == [[], [4]]
+
+    def test_pad(self, ragged):
+        assert ragged.pad().tolist() == [
+            [1, 2, 3], [0, 0, 0], [4, 0, 0], [5, 6, 0]]
+        assert ragged.pad(2).tolist() == [[1, 2], [0, 0], [4, 0], [5, 6]]
+
+    def test_immutable(self, ragged):
+        with pytest.raises(ValueError):
+            ragged.values[0] = 0
+
+    def test_dataset(self, ragged):
+        dataset = Dataset(data=ragged, target=[0, 1, 2, 3])
+        assert len(dataset) == 4
+        assert dataset[1:].data == ragged[1:]
+        assert dataset[[3, 1]].data == ragged[[3, 1]]
+        rows = list(dataset)
+        assert rows[3][0].tolist() == [5, 6]
+        assert pickle.loads(pickle.dumps(dataset)) == dataset
+        assert dataset != Dataset(data=ragged.pad(), target=[0, 1, 2, 3])
+
+    def test_save_and_open(self, ragged, tmpdir):
+        dataset = Dataset(data=ragged)
+        dataset.save(str(tmpdir))
+        assert Dataset.open(str(tmpdir)) == dataset
+
+
+class TestBatches:
+
+    @pytest.fixture
+    def dataset(self):
+        return Dataset(data=np.arange(10), target=np.arange(10) * 2)
+
+    @pytest.mark.parametrize('prefetch', [0, 2])
+    def test_batches(self, dataset, prefetch):
+        batches = list(dataset.batches(4, prefetch=prefetch))
+        assert [len(x['data']) for x in batches] == [4, 4, 2]
+        assert (batches[1]['data'] == [4, 5, 6, 7]).all()
+        assert (batches[1]['target'] == [8, 10, 12, 14]).all()
+
+    def test_shuffle_and_drop_last(self, dataset):
+        first = list(dataset.batches(3, shuffle=True, seed=0, drop_last=True))
+        second = list(dataset.batches(3, shuffle=True, seed=0))
+        assert len(first) == 3 and len(second) == 4
+        data = np.concatenate([x['data'] for x in second])
+        assert sorted(data.tolist()) == list(range(10))
+        assert (data[:9] == np.concatenate([x['data'] for x in first])).all()
+        target = np.concatenate([x['target'] for x in second])
+        assert (data * 2 == target).all()
+
+    def test_steps(self, dataset):
+        def double(batch):
+            batch = batch.copy()
+            batch['data'] = batch['data'] * 2
+            return batch
+        batches = dataset.batches(5, steps=[double], prefetch=1)
+        assert [x['data'].tolist() for x in batches] == [
+            [0, 2, 4, 6, 8], [10, 12, 14, 16, 18]]
+
+    def test_prefetch_error(self, dataset):
+        def fail(batch):
+            raise KeyError(batch)
+        with pytest.raises(KeyError):
+            list(dataset.batches(5, steps=[fail], prefetch=1))
+
+    def test_prefetch_exit(self, dataset):
+        def fail(batch):
+            raise SystemExit(len(batch))
+        with pytest.raises(SystemExit):
+            list(dataset.batches(5, steps=[fail], prefetch=1))
+
+    def test_prefetch_stops_early(self, dataset):
+        batches = dataset.batches(1, prefetch=1)
+        assert next(batches)['data'] == [0]
+        batches.close()
+
+
+class TestRows:
+
+    def test_iterate(self, dataset):
+        rows = list(dataset)
+        assert len(rows) == 3
+        assert rows[2][1] == -1
+        assert (rows[1][0] == dataset.arrays[1]).all()
+        assert rows[0][2] == 'hello'
+
+    def test_itertuples(self, dataset):
+        rows = list(dataset.itertuples(chunk=2))
+        assert [x.strings for x in rows] == ['hello', 'world', '!']
+        assert [x.numbers for x in rows] == [0, 0.5, -1]
+
+    def test_iter_chunks(self, dataset):
+        chunks = list(dataset.iter_chunks(2))
+        assert [len(x) for x in chunks] == [2, 1]
+        assert np.shares_memory(chunks[0].arrays, dataset.arrays)
+
+    def test_to_records(self, dataset):
+        records = dataset.to_records()
+        assert records.dtype.names == ('arrays', 'numbers', 'strings')
+        assert records['arrays'].shape == (3, 2)
+        assert (records['arrays'] == dataset.arrays).all()
+        assert records[1]['strings'] == 'world'
+
+    def test_columns_cached(self, dataset):
+        assert dataset.columns == ['arrays', 'numbers', 'strings']
+        dataset['another'] = [1, 2, 3]
+        assert dataset.columns[0] == 'another'
+        del dataset['another']
+        assert dataset.columns == ['arrays', 'numbers', 'strings']
+
+
+class TestWriter:
+
+    @pytest.fixture
+    def written(self, tmpdir):
+        directory = str(tmpdir.join('written'))
+        with DatasetWriter(directory, chunk_size=4) as writer:
+            for index in range(7):
+                writer.append(number=index, word='w' * index)
+            writer.extend(number=[7, 8], word=['a', 'b'])
+        return directory
+
+    def test_open_as_one_dataset(self, written):
+        dataset = Dataset.open(written)
+        assert len(dataset) == 9
+        assert dataset.number.tolist() == list(range(9))
+        assert dataset.word[6] == 'wwwwww'
+        assert dataset[3:5].number.tolist() == [3, 4]
+        assert dataset[[8, 0, 5]].word.tolist() == ['b', '', 'wwwww']
+
+    def test_open_chunks(self, written):
+        chunks = list(Dataset.open_chunks(written))
+        assert [len(x) for x in chunks] == [4, 4, 1]
+        assert isinstance(chunks[0]['number'], np.memmap)
+
+    def test_slice_within_chunk_is_view(self, written):
+        column = Dataset.open(written)._data['number']
+        assert isinstance(column, Concatenation)
+        assert isinstance(column[4:6], np.memmap)
+        assert isinstance(column[2:6], Concatenation)
+
+    def test_strings_stored_as_text(self, written):
+        dataset = Dataset.open(written)
+        assert isinstance(dataset.word, Text)
+        assert dataset.word is dataset.word
+        assert dataset.word.tolist()[5:] == ['wwwww', 'wwwwww', 'a', 'b']
+        assert dataset[[6, 1, 8]].word.tolist() == ['wwwwww', 'w', 'b']
+        batches = [x['word'].tolist() for x in dataset.batches(3)]
+        assert batches[1] == ['www', 'wwww', 'wwwww']
+
+    def test_long_text_not_padded(self, tmpdir):
+        directory = str(tmpdir.join('written'))
+        with DatasetWriter(directory, chunk_size=4) as writer:
+            for index in range(8):
+                writer.append(content='x' * (100000 if index == 3 else 10))
+        column = Dataset.open(directory).content
+        assert len(column.values) == 100000 + 7 * 10
+        assert column[3] == 'x' * 100000
+
+    def test_error_removes_data(self, tmpdir):
+        directory = tmpdir.join('written')
+        with pytest.raises(KeyError):
+            with DatasetWriter(str(directory), chunk_size=1) as writer:
+                writer.append(number=1)
+                raise KeyError
+        assert not tmpdir.listdir()
+
+    def test_columns_must_match(self, tmpdir):
+        writer = DatasetWriter(str(tmpdir.join('written')))
+        writer.append(number=1)
+        with pytest.raises(ValueError):
+            writer.append(other=1)
+        writer.abort()
@@ -1,3 +1,7 @@
+import bz2
+import gzip
+import struct
+import numpy as np
 import sets
 import pytest
 
@@ -24,3 +28,103 @@ def test_wikipedia():
     url = 'https://dumps.wikimedia.org/enwiki/20160501/' \
           'enwiki-20160501-pages-meta-current1.xml-p000000010p000030303.bz2'
     dataset = sets.Wikipedia(url, 100)
+
+
+def test_mnist_read(tmpdir):
+    images = np.random.randint(0, 256, (5, 3, 2)).astype(np.uint8)
+    labels = np.array([3, 0, 9, 3, 1], dtype=np.uint8)
+    data = str(tmpdir.join('images.gz'))
+    target = str(tmpdir.join('labels.gz'))
+    with gzip.open(data, 'wb') as file_:
+        file_.write(struct.pack('>IIII', 2051, 5, 3, 2) + images.tobytes())
+    with gzip.open(target, 'wb') as file_:
+        file_.write(struct.pack('>II', 2049, 5) + labels.tobytes())
+    dataset = sets.Mnist._read_dataset(data, target)
+    assert dataset.data.dtype == np.uint8
+    assert (dataset.data == images).all()
+    assert (dataset.target.argmax(axis=1) == labels).all()
+    assert (dataset.target.sum(axis=1) == 1).all()
+    scaled = sets.Mnist._convert(dataset, np.float32)
+    assert scaled.data.dtype == scaled.target.dtype == np.float32
+    assert np.allclose(scaled.data, images / 255)
+    assert sets.Mnist._convert(dataset, np.uint8) is dataset
+    with pytest.raises(ValueError):
+        sets.Mnist._convert(dataset, np.int32)
+
+
+def test_ocr_parse(tmpdir):
+    letters = [
+        # id, letter, next id, word, position, fold
+        (3, 'c', -1, 2, 1, 1),
+        (1, 'a', 2, 1, 1, 0),
+        (2, 'b', -1, 1, 2, 0),
+    ]
+    filepath = str(tmpdir.join('letter.data.gz'))
+    with gzip.open(filepath, 'wt') as file_:
+        for index, letter in enumerate(letters):
+            pixels = [str((index + x) % 2) for x in range(128)]
+            fields = [str(x) for x in letter] + pixels + ['']
+            file_.write('\t'.join(fields) + '\n')
+    data, target, fold = sets.Ocr._parse(sets.Ocr._read(filepath))
+    assert data.shape == (2, 2, 16, 8)
+    assert target.tolist() == [['a', 'b'], ['c', '']]
+    assert target.dtype == np.dtype('<U1')
+    assert fold.tolist() == [0, 1]
+    assert (data[0, 0].ravel() == (np.arange(128) + 1) % 2).all()
+    assert (data[0, 1].ravel() == np.arange(128) % 2).all()
+    assert not data[1, 1].any()
+    dataset = sets.Dataset(data=data, target=target, fold=fold)
+    converted = sets.Ocr._convert(dataset, np.float64)
+    assert converted.data.dtype == np.float64
+    assert (converted.data == data).all()
+    assert sets.Ocr._convert(dataset, np.uint8) is dataset
+
+
+def _write_multistream(tmpdir, pages, per_stream):
+    header = (
+        '<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">'
+        '<siteinfo><sitename>Test</sitename></siteinfo>\n')
+    template = (
+        '  <page>\n    <title>{title}</title>\n    <id>{id}</id>\n{redirect}'
+        '    <revision><text>{text}</text></revision>\n  </page>\n')
+    streams = [bz2.compress(header.encode())]
+    offsets = []
+    for start in range(0, len(pages), per_stream):
+        offset = sum(len(x) for x in streams)
+        chunk = pages[start:start + per_stream]
+        text = ''.join(template.format(**x) for x in chunk)
+        streams.append(bz2.compress(text.encode()))
+        offsets += ['{}:{}:{}'.format(offset, x['id'], x['title'])
+                    for x in chunk]
+    streams.append(bz2.compress(b'</mediawiki>\n'))
+    filepath = str(tmpdir.join('dump.xml.bz2'))
+    index = str(tmpdir.join('index.txt.bz2'))
+    with open(filepath, 'wb') as file_:
+        file_.write(b''.join(streams))
+    with bz2.open(index, 'wt') as file_:
+        file_.write('\n'.join(offsets) + '\n')
+    return filepath, index
+
+
+def test_wikipedia_multistream(tmpdir):
+    pages = [{
+        'id': x, 'title': 'Title {}'.format(x),
+        'text': 'Some Text {} here'.format(x),
+        'redirect': '    <redirect title="Other" />\n' if x % 4 == 3 else '',
+    } for x in range(1, 12)]
+    filepath, index = _write_multistream(tmpdir, pages, per_stream=3)
+    parse = sets.Wikipedia._parse
+    multistream = sets.Wikipedia._parse_multistream
+    parse(str(tmpdir.join('sequential')), filepath)
+    expected = sets.Dataset.open(str(tmpdir.join('sequential')))
+    assert len(expected) == 8
+    multistream(str(tmpdir.join('parallel')), filepath, index, workers=2)
+    dataset = sets.Dataset.open(str(tmpdir.join('parallel')))
+    assert dataset == expected
+    assert dataset.title[0] == 'title'
+    parse(str(tmpdir.join('first')), filepath, amount=5)
+    multistream(
+        str(tmpdir.join('first-parallel')), filepath, index, 5, workers=2)
+    dataset = sets.Dataset.open(str(tmpdir.join('first-parallel')))
+    assert len(dataset) == 5
+    assert dataset == sets.Dataset.open(str(tmpdir.join('first')))
@@ -0,0 +1,164 @@
+# pylint: disable=no-self-use
+import os
+import re
+import hashlib
+import threading
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import pytest
+import sets
+
+
+CONTENT = bytes(range(256)) * 1000
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    ranges = True
+    etag = '"content"'
+    ignore_ranges = False
+    requests = []
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def _respond(self, body):
+        type(self).requests.append(self.headers.get('Range'))
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        changed = self.headers.get('If-Range', self.etag) != self.etag
+        ignore = body and self.ignore_ranges
+        if not self.ranges or not match or changed or ignore:
+            self._send(200, CONTENT, body)
+            return
+        start = int(match.group(1))
+        end = int(match.group(2)) + 1 if match.group(2) else len(CONTENT)
+        if start >= len(CONTENT):
+            self.send_response(416)
+            self.send_header('Content-Range', 'bytes */{}'.format(
+                len(CONTENT)))
+            self.end_headers()
+            return
+        self._send(206, CONTENT[start:end], body)
+
+    def _send(self, status, data, body):
+        self.send_response(status)
+        if self.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', self.etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def log_message(self, *args):
+        # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.ranges = True
+    Handler.ignore_ranges = False
+    Handler.requests = []
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield 'http://127.0.0.1:{}/file.bin'.format(httpd.server_port)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestDownload:
+
+    def test_download(self, server, tmpdir):
+        filepath = sets.utility.download(server, str(tmpdir))
+        assert open(filepath, 'rb').read() == CONTENT
+        assert os.listdir(str(tmpdir)) == ['file.bin']
+
+    def test_existing_file_is_kept(self, server, tmpdir):
+        tmpdir.join('file.bin').write_binary(b'old')
+        filepath = sets.utility.download(server, str(tmpdir))
+        assert open(filepath, 'rb').read() == b'old'
+        assert not Handler.requests
+
+    def test_resume_partial(self, server, tmpdir):
+        tmpdir.join('file.bin.part').write_binary(CONTENT[:1000])
+        filepath = sets.utility.download(server, str(tmpdir))
+        assert open(filepath, 'rb').read() == CONTENT
+        assert Handler.requests == ['bytes=1000-']
+
+    def test_resume_complete_partial(self, server, tmpdir):
+        tmpdir.join('file.bin.part').write_binary(CONTENT)
+        filepath = sets.utility.download(server, str(tmpdir))
+        assert open(filepath, 'rb').read() == CONTENT
+
+    def test_oversized_partial_downloaded_again(self, server, tmpdir):
+        tmpdir.join('file.bin.part').write_binary(CONTENT + b'stale')
+        filepath = sets.utility.download(server, str(tmpdir))
+        assert open(filepath, 'rb').read() == CONTENT
+
+    def test_changed_file_downloaded_again(self, server, tmpdir):
+        tmpdir.join('file.bin.part').write_binary(b'x' * 1000)
+        tmpdir.join('file.bin.part.validator').write('"old"')
+        filepath = sets.utility.download(server, str(tmpdir))
+        assert open(filepath, 'rb').read() == CONTENT
+        assert os.listdir(str(tmpdir)) == ['file.bin']
+
+    def test_restart_without_ranges(self, server, tmpdir):
+        Handler.ranges = False
+        tmpdir.join('file.bin.part').write_binary(b'garbage')
+        filepath = sets.utility.download(server, str(tmpdir), segments=4)
+        assert open(filepath, 'rb').read() == CONTENT
+
+    def test_segments(self, server, tmpdir):
+        filepath = sets.utility.download(server, str(tmpdir), segments=3)
+        assert open(filepath, 'rb').read() == CONTENT
+        assert len([x for x in Handler.requests if x]) == 3
+        assert os.listdir(str(tmpdir)) == ['file.bin']
+
+    def test_resume_segments(self, server, tmpdir):
+        tmpdir.join('file.bin.part.validator').write('"content"')
+        tmpdir.join('file.bin.part.0').write_binary(CONTENT[:85333])
+        tmpdir.join('file.bin.part.1').write_binary(CONTENT[85333:90000])
+        filepath = sets.utility.download(server, str(tmpdir), segments=3)
+        assert open(filepath, 'rb').read() == CONTENT
+        assert Handler.requests == [
+            None, 'bytes=90000-170665', 'bytes=170666-255999']
+
+    def test_changed_file_segments_downloaded_again(self, server, tmpdir):
+        tmpdir.join('file.bin.part.validator').write('"old"')
+        tmpdir.join('file.bin.part.0').write_binary(b'x' * 85333)
+        tmpdir.join('file.bin.part.1').write_binary(b'x' * 1000)
+        filepath = sets.utility.download(server, str(tmpdir), segments=3)
+        assert open(filepath, 'rb').read() == CONTENT
+        assert os.listdir(str(tmpdir)) == ['file.bin']
+
+    def test_segments_without_ranges_downloaded_again(self, server, tmpdir):
+        Handler.ignore_ranges = True
+        tmpdir.join('file.bin.part.validator').write('"content"')
+        tmpdir.join('file.bin.part.1').write_binary(b'x' * 1000)
+        filepath = sets.utility.download(server, str(tmpdir), segments=3)
+        assert open(filepath, 'rb').read() == CONTENT
+        assert os.listdir(str(tmpdir)) == ['file.bin']
+
+    def test_checksum(self, server, tmpdir):
+        checksum = hashlib.sha256(CONTENT).hexdigest()
+        sets.utility.download(server, str(tmpdir), checksum=checksum)
+        with pytest.raises(ValueError):
+            sets.utility.download(
+                server, str(tmpdir), 'other.bin', checksum='0' * 64)
+        assert os.listdir(str(tmpdir)) == ['file.bin']
+
+    def test_download_all(self, server, tmpdir):
+        reports = []
+        urls = [server + '?{}'.format(x) for x in range(5)]
+        filenames = ['{}.bin'.format(x) for x in range(5)]
+        filepaths = sets.utility.download_all(
+            urls, str(tmpdir), filenames, workers=2,
+            progress=lambda *x: reports.append(x))
+        assert filepaths == [str(tmpdir.join(x)) for x in filenames]
+        assert all(open(x, 'rb').read() == CONTENT for x in filepaths)
+        assert sorted(x[0] for x in reports) == [1, 2, 3, 4, 5]
+        assert all(x[1] == 5 for x in reports)
@@ -1,3 +1,5 @@
+import io
+import pickle
 import numpy as np
 import pytest
 import sets
@@ -18,12 +20,71 @@ def test_concat(dataset):
     assert result.data.shape[1] == dataset.data.shape[1] + 1
     assert (result.data[:, :-1] == dataset.data).all()
 
+def test_concat_memmap(dataset, tmpdir):
+    dataset['other'] = [[1], [2], [3]]
+    filename = str(tmpdir.join('concat.bin'))
+    concat = sets.Concat(1, filename=filename)
+    result = concat(dataset, columns=('data', 'other'))
+    assert isinstance(result.data, np.memmap)
+    assert not result.data.flags.writeable
+    assert (result.data == [[1, 3, 1], [0, -1.5, 2], [0, 0, 3]]).all()
+
+def test_concat_memmap_not_overwritten(dataset, tmpdir):
+    filename = str(tmpdir.join('concat.bin'))
+    concat = sets.Concat(1, filename=filename)
+    dataset['ones'] = np.ones((3, 2))
+    dataset['other'] = np.ones((3, 1))
+    first = concat(dataset, columns=('ones', 'other'))
+    second = concat(dataset[:1], columns=('data', 'other'))
+    assert (first.data == 1).all()
+    assert second.data.tolist() == [[1, 3, 1]]
+    assert sorted(x.basename for x in tmpdir.listdir()) == [
+        'concat-1.bin', 'concat.bin']
+
+def test_concat_lazy(dataset):
+    dataset['other'] = [[1], [2], [3]]
+    expected = sets.Concat(1)(dataset, columns=('data', 'other'))
+    result = sets.Concat(1, lazy=True)(dataset, columns=('data', 'other'))
+    assert isinstance(result._data['data'], sets.Concatenation)
+    assert (result[1:]._data['data'][0] == expected.data[1]).all()
+    batches = [x['data'] for x in result.batches(2)]
+    assert (np.concatenate(batches) == expected.data).all()
+    assert result == expected
+
 def test_onehot(dataset):
     result = sets.OneHot(dataset.target)(dataset, columns=['target'])
     assert result.target.shape[1] == len(np.unique(dataset.target))
     assert (result.target.sum(axis=1)).all()
     assert (result.target.max(axis=1)).all()
 
+def test_onehot_sparse():
+    dataset = sets.Dataset(data=[['b', 'x', ''], ['c', 'a', 'b']])
+    dense = sets.OneHot(list('abc'), depth=2)
+    sparse = sets.OneHot(list('abc'), depth=2, sparse=True)
+    result, found = sparse(dataset, return_found=True)
+    expected, expected_found = dense(dataset, return_found=True)
+    assert result.data.tolist() == [[1, -2, -1], [2, 0, 1]]
+    assert found == expected_found
+    assert (sparse.densify(result.data) == expected.data).all()
+    vocabulary = sets.Vocabulary(list('abcd'))
+    encoded = sparse(vocabulary(dataset), vocabulary=vocabulary)
+    assert (encoded.data == result.data).all()
+
+def test_onehot_sparse_ragged():
+    tokens = sets.Ragged.from_sequences([['a', 'b'], ['x']], dtype=str)
+    onehot = sets.OneHot(list('ab'), depth=2, sparse=True)
+    result = onehot(sets.Dataset(data=tokens)).data
+    assert result.values.tolist() == [0, 1, -2]
+    dense = onehot.densify(result)
+    assert (dense.values == [[1, 0], [0, 1], [0.5, 0.5]]).all()
+
+def test_onehot_most_similar():
+    onehot = sets.OneHot(list('abc'))
+    with pytest.raises(ValueError):
+        onehot.most_similar('a')
+    with pytest.raises(ValueError):
+        onehot.most_similar_batch(np.eye(3))
+
 def test_split(dataset):
     one, two = sets.Split(0.5)(dataset)
     assert len(one) + len(two) == len(dataset)
@@ -55,3 +116,281 @@ def test_embedding_found():
     dataset, found = sets.OneHot(vocabulary)(
         dataset, columns=['data', 'target'], return_found=True)
     assert found == 6 / 10
+
+def test_embedding_lookup():
+    words = ['a', 'b', 'c']
+    embeddings = np.arange(6).reshape((3, 2))
+    embedding = sets.core.Embedding(words, embeddings, depth=2)
+    data = [['b', 'x', ''], ['c', 'a', 'b']]
+    dataset = sets.Dataset(data=data)
+    result, found = embedding(dataset, return_found=True)
+    assert result.data.shape == (2, 3, 2)
+    assert (result.data[0, 0] == embeddings[1]).all()
+    assert (result.data[0, 1] == embeddings.mean(axis=0)).all()
+    assert (result.data[0, 2] == 0).all()
+    assert (result.data[1] == embeddings[[2, 0, 1]]).all()
+    assert found == 5 / 6
+
+def test_embedding_array_words():
+    words = [[0, 1], [1, 0]]
+    embedding = sets.core.Embedding(np.array(words), np.eye(2), depth=1)
+    dataset = sets.Dataset(data=[[1, 0], [1, 1], [0, 1]])
+    result = embedding(dataset)
+    assert (result.data == [[0, 1], [0.5, 0.5], [1, 0]]).all()
+
+@pytest.mark.parametrize('storage', ['float16', 'int8'])
+def test_embedding_storage(storage):
+    random = np.random.RandomState(0)
+    embeddings = random.normal(size=(100, 16)).astype(np.float32)
+    embedding = sets.core.Embedding(
+        range(100), embeddings, depth=1, storage=storage)
+    assert embedding.embeddings.nbytes < embeddings.nbytes
+    dataset = sets.Dataset(data=[3, 7, -1])
+    result = embedding(dataset)
+    assert result.data.dtype == np.float32
+    assert np.allclose(result.data[:2], embeddings[[3, 7]], atol=0.02)
+    assert np.allclose(result.data[2], embeddings.mean(axis=0), atol=0.01)
+    assert np.allclose(embedding[5], embeddings[5], atol=0.02)
+    assert embedding.most_similar(3, k=1)[0][0] != 3
+    loaded = pickle.loads(pickle.dumps(embedding))
+    assert (loaded(dataset).data == result.data).all()
+
+def test_embedding_output_dtype():
+    embeddings = np.arange(6, dtype=np.float32).reshape((3, 2))
+    embedding = sets.core.Embedding(list('abc'), embeddings, depth=1)
+    assert embedding(sets.Dataset(data=list('ab'))).data.dtype == np.float32
+    embedding = sets.core.Embedding(
+        list('abc'), embeddings, depth=1, dtype=np.float16)
+    result = embedding(sets.Dataset(data=list('ax')))
+    assert result.data.dtype == np.float16
+    assert (result.data == [[0, 1], [2, 3]]).all()
+
+def test_embedding_fingerprint_state():
+    words = ['w{}'.format(x) for x in range(1000)]
+    embedding = sets.core.Embedding(words, np.ones((1000, 4)), depth=1)
+    before = sets.fingerprint(embedding)
+    assert '_index' not in embedding.__getstate__()
+    embedding(sets.Dataset(data=['w1', 'x']))
+    embedding.most_similar('w1')
+    assert sets.fingerprint(embedding) == before
+    loaded = pickle.loads(pickle.dumps(embedding))
+    assert 'w999' in loaded
+    assert sets.fingerprint(loaded) == before
+    other = sets.core.Embedding(words, np.ones((1000, 4)), depth=2)
+    assert sets.fingerprint(other) != before
+
+def test_embedding_most_similar():
+    words = ['north', 'south', 'east', 'nothing']
+    embeddings = np.array([[1, 0.1], [-1, 0], [0.1, 1], [0, 0]])
+    embedding = sets.core.Embedding(words, embeddings, depth=1)
+    similar = embedding.most_similar('north', k=2)
+    assert [x for x, _ in similar] == ['east', 'nothing']
+    similar = embedding.most_similar(np.array([-2, 0.1]), k=1)
+    assert similar[0][0] == 'south'
+    assert similar[0][1] == pytest.approx(
+        np.dot([-2, 0.1], [-1, 0]) / np.hypot(-2, 0.1))
+
+def test_embedding_most_similar_batch():
+    embeddings = np.random.RandomState(0).normal(size=(500, 8))
+    embedding = sets.core.Embedding(range(500), embeddings, depth=1)
+    queries = embeddings[:30] + 0.01
+    indices, similarities = embedding.most_similar_batch(queries, k=5)
+    assert (indices[:, 0] == np.arange(30)).all()
+    assert (np.diff(similarities, axis=1) <= 0).all()
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1)[:, None]
+    expected = np.argsort(-(queries @ normalized.T), axis=1)[:, :5]
+    assert (indices == expected).all()
+
+def test_hash_index_recall():
+    random = np.random.RandomState(0)
+    centers = random.normal(size=(50, 32))
+    embeddings = np.repeat(centers, 40, axis=0)
+    embeddings += 0.3 * random.normal(size=embeddings.shape)
+    embedding = sets.core.Embedding(range(2000), embeddings, depth=1)
+    index = sets.HashIndex(embeddings, bits=8, tables=8, seed=0)
+    queries = embeddings[random.choice(2000, 100)]
+    exact, _ = embedding.most_similar_batch(queries, k=10)
+    approximate, _ = embedding.most_similar_batch(queries, k=10, index=index)
+    recall = np.mean([
+        len(np.intersect1d(x, y)) / 10 for x, y in zip(exact, approximate)])
+    assert recall > 0.9
+    assert len(index.candidates(queries[0])) < len(embeddings) / 2
+
+def test_vocabulary():
+    dataset = sets.Dataset(data=[['b', 'a', ''], ['c', 'b', 'b']])
+    vocabulary = sets.Vocabulary.fit(dataset, min_count=2)
+    assert vocabulary.words.tolist() == ['b']
+    vocabulary = sets.Vocabulary.fit(dataset)
+    assert len(vocabulary) == 5
+    encoded = vocabulary(dataset)
+    assert encoded.data.dtype == np.int32
+    assert encoded.data.tolist() == [[3, 2, 0], [4, 3, 3]]
+    assert vocabulary.encode(['x', 'c']).tolist() == [1, 4]
+    assert vocabulary.decode([[1, 4, 0]]).tolist() == [['<unk>', 'c', '']]
+    assert 'a' in vocabulary and 'x' not in vocabulary
+    assert sets.Vocabulary(['0', '']).encode(['0', '']).tolist() == [2, 0]
+
+def test_vocabulary_ragged():
+    tokens = sets.Ragged.from_sequences([['a', 'b'], ['x']], dtype=str)
+    vocabulary = sets.Vocabulary(['a', 'b'])
+    encoded = vocabulary(sets.Dataset(data=tokens)).data
+    assert isinstance(encoded, sets.Ragged)
+    assert encoded.values.tolist() == [2, 3, 1]
+    assert vocabulary.decode(encoded) == sets.Ragged.from_sequences(
+        [['a', 'b'], ['<unk>']], dtype=str)
+
+def test_embedding_vocabulary():
+    words = ['a', 'b', 'c']
+    embeddings = np.arange(6).reshape((3, 2))
+    embedding = sets.core.Embedding(words, embeddings, depth=2)
+    dataset = sets.Dataset(data=[['b', 'x', ''], ['c', 'a', 'b']])
+    expected, found = embedding(dataset, return_found=True)
+    vocabulary = sets.Vocabulary(['a', 'b', 'c', 'd'])
+    encoded = vocabulary(dataset)
+    result, found_ids = embedding(
+        encoded, return_found=True, vocabulary=vocabulary)
+    assert (result.data == expected.data).all()
+    assert found_ids == found
+    onehot = sets.OneHot(words, depth=2)
+    result = onehot(encoded, vocabulary=vocabulary)
+    assert (result.data == onehot(dataset).data).all()
+
+def test_glove_parse():
+    lines = b'the 0.1 -0.2 0.3\nof 1 2 3\nnew york 4 5 6\n'
+    words, embeddings = sets.Glove._parse(io.BytesIO(lines), 3, chunk=10)
+    assert words.tolist() == ['the', 'of', 'new york']
+    assert embeddings.dtype == np.float32
+    assert np.allclose(embeddings, [[0.1, -0.2, 0.3], [1, 2, 3], [4, 5, 6]])
+
+@pytest.mark.parametrize('workers', [None, 3])
+def test_tokenize(monkeypatch, workers):
+    # Avoid depending on the NLTK tokenizer models.
+    monkeypatch.setattr(
+        sets.Tokenize, '_split', staticmethod(lambda x: x.lower().split()))
+    sentences = ['A <e1> b', 'c d e <e2>', 'F'] * 5
+    dataset = sets.Dataset(data=sentences)
+    result = sets.Tokenize(workers, chunk=2)(dataset)
+    assert result.data.shape == (15, 4)
+    assert result.data[0].tolist() == ['a', '<e1>', 'b', '']
+    assert result.data[1].tolist() == ['c', 'd', 'e', '<e2>']
+    assert result.data[14].tolist() == ['f', '', '', '']
+
+def test_bucket():
+    tokens = [
+        ['a', 'b', 'c', 'd', 'e'],
+        ['a', '', '', '', ''],
+        ['a', 'b', 'c', '', ''],
+        ['a', 'b', '', '', ''],
+    ]
+    dataset = sets.Dataset(data=tokens, target=[0, 1, 2, 3])
+    buckets = list(sets.Bucket(2, 3)(dataset, 'data'))
+    assert [len(x) for x in buckets] == [2, 1, 1]
+    assert [x.data.shape[1] for x in buckets] == [2, 3, 5]
+    assert buckets[0].target.tolist() == [1, 3]
+    assert buckets[0].index.tolist() == [1, 3]
+    assert buckets[0].data.base is None or buckets[0].data.base.shape[1] == 2
+    restored = sets.Bucket.restore(buckets)
+    assert restored == dataset
+
+def test_bucket_batches():
+    dataset = sets.Dataset(data=np.random.random((10, 3)))
+    batches = list(sets.Bucket(amount=2)(dataset, 'data', size=4))
+    assert [len(x) for x in batches] == [4, 4, 2]
+    assert sets.Bucket.restore(batches) == dataset
+
+def test_ragged_tokens(monkeypatch):
+    monkeypatch.setattr(
+        sets.Tokenize, '_split', staticmethod(lambda x: x.lower().split()))
+    dataset = sets.Dataset(data=['A <e1> b c <e2>', 'd <e2> <e1>'])
+    dataset = sets.Tokenize(ragged=True)(dataset)
+    assert isinstance(dataset.data, sets.Ragged)
+    assert dataset.data.lengths.tolist() == [5, 3]
+    distance = sets.WordDistance('<e1>', '<e2>')(dataset, 'data')
+    assert distance.word_distance.lengths.tolist() == [5, 3]
+    vocabulary = ['a', 'b', 'c', 'd', '<e1>', '<e2>']
+    embedded = sets.OneHot(vocabulary, depth=2)(dataset, columns=['data'])
+    assert embedded.data.values.shape == (8, 6)
+    assert (embedded.data.values.sum(axis=1) == 1).all()
+
+def test_word_distance():
+    tokens = [['a', '<e1>', 'b', '<e2>'], ['<e2>', '<e1>', '', '']]
+    dataset = sets.Dataset(data=tokens)
+    result = sets.WordDistance('<e1>', '<e2>')(dataset, 'data')
+    assert result.word_distance.shape == (2, 4, 2)
+    assert result.word_distance[0, :, 0].tolist() == [-1, 0, 1, 2]
+    assert result.word_distance[0, :, 1].tolist() == [-3, -2, -1, 0]
+    assert result.word_distance[1, :, 0].tolist() == [-1, 0, 1, 2]
+    assert result.word_distance[1, :, 1].tolist() == [0, 1, 2, 3]
+    ragged = sets.Dataset(data=sets.Ragged.from_sequences(tokens))
+    ragged = sets.WordDistance('<e1>', '<e2>')(ragged, 'data')
+    assert (ragged.word_distance.pad() == result.word_distance).all()
+
+def test_word_distance_missing_tag():
+    dataset = sets.Dataset(data=[['<e1>', '<e2>'], ['<e1>', 'a']])
+    with pytest.raises(ValueError) as error:
+        sets.WordDistance('<e1>', '<e2>')(dataset, 'data')
+    assert 'row 1 lacks <e2>' in str(error.value)
+
+def test_normalize_chunks():
+    data = np.random.normal(5, 3, (100, 4))
+    dataset = sets.Dataset(data=data)
+    full = sets.Normalize(dataset)
+    chunks = sets.Normalize(dataset[i:i + 30] for i in range(0, 100, 30))
+    assert np.allclose(chunks.mean('data'), data.mean(axis=0))
+    assert np.allclose(chunks.std('data'), data.std(axis=0))
+    merged = sets.Normalize(dataset[:50]).merge(sets.Normalize(dataset[50:]))
+    assert np.allclose(merged.std('data'), full.std('data'))
+    rows = sets.Normalize().update(dataset, chunk=7)
+    assert np.allclose(rows.mean('data'), full.mean('data'))
+    assert np.allclose(rows.std('data'), full.std('data'))
+    restored = pickle.loads(pickle.dumps(chunks))
+    assert np.allclose(restored.mean('data'), full.mean('data'))
+
+def test_normalize_output():
+    dataset = sets.Dataset(data=np.random.normal(5, 3, (100, 4)))
+    normalize = sets.Normalize(dataset)
+    result = normalize(dataset, dtype=np.float32)
+    assert result.data.dtype == np.float32
+    assert np.allclose(result.data.mean(axis=0), 0, atol=1e-5)
+    array = dataset.data.copy()
+    normalize.transform(array, 'data', out=array, chunk=7)
+    assert np.allclose(array, normalize(dataset).data)
+
+def test_split_shuffled():
+    dataset = sets.Dataset(data=np.arange(100), target=np.arange(100) % 4)
+    first = list(sets.Split(0.75, shuffle=True, seed=0)(dataset))
+    second = list(sets.Split(0.75, shuffle=True, seed=0)(dataset))
+    assert [len(x) for x in first] == [75, 25]
+    assert first == second
+    data = np.concatenate([x.data for x in first])
+    assert sorted(data.tolist()) == list(range(100))
+    assert data.tolist() != list(range(100))
+
+def test_split_stratified():
+    target = np.array([0] * 80 + [1] * 20)
+    dataset = sets.Dataset(data=np.arange(100), target=target)
+    train, test = sets.Split(0.5, stratify='target')(dataset)
+    assert (train.target == 1).sum() == (test.target == 1).sum() == 10
+    assert (np.diff(train.data) > 0).all()
+
+def test_kfold():
+    target = np.eye(3)[np.arange(30) % 3]
+    dataset = sets.Dataset(data=np.arange(30), target=target)
+    folds = list(sets.KFold(5, shuffle=True, seed=1, stratify='target')(
+        dataset))
+    assert len(folds) == 5
+    tested = np.concatenate([test.data for _, test in folds])
+    assert sorted(tested.tolist()) == list(range(30))
+    for train, test in folds:
+        assert len(train) == 24 and len(test) == 6
+        assert (test.target.sum(axis=0) == 2).all()
+        assert not set(train.data) & set(test.data)
+
+def test_take_is_lazy():
+    # pylint: disable=protected-access
+    dataset = sets.Dataset(data=np.arange(10), other=np.arange(10) * 2)
+    view = dataset.take([7, 2, 5])
+    assert isinstance(view._data['data'], sets.Take)
+    assert view.data.tolist() == [7, 2, 5]
+    assert view[1:].other.tolist() == [4, 10]
+    assert view.take([2])._data['data'].base is dataset._data['data']